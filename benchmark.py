@@ -0,0 +1,342 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import resource
+import tempfile
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Any
+
+from rufus import Rufus
+
+FILLER_WORDS = (
+    'city', 'service', 'program', 'department', 'public', 'resident', 'permit', 'office',
+    'report', 'meeting', 'policy', 'community', 'support', 'information', 'request', 'schedule'
+)
+TOPIC_WORDS = ('employee', 'benefits', 'hiring', 'salary', 'retirement', 'leave')
+# Site-wide template shared by every page, as on most real sites
+SITE_HEADER = (
+    '<header><ul><li>Home</li><li>Services</li><li>Departments</li><li>News</li>'
+    '<li>Public meetings</li><li>Contact us</li></ul><p>An official website of the city</p></header>'
+)
+SITE_FOOTER = (
+    '<footer><p>Accessibility</p><p>Privacy policy</p><p>Language assistance</p>'
+    '<p>City offices are open Monday to Friday, 8 a.m. to 5 p.m.</p></footer>'
+)
+
+# Below this share of the site crawled, the run says little about throughput
+MIN_COVERAGE = 0.25
+
+class SyntheticSite:
+    """
+    Deterministic generated website: a tree of pages with extra cross links, a share of pages
+    about the benchmark topic, and optionally pages whose content is rendered by JavaScript.
+    """
+
+    def __init__(self, pages: int = 200, fanout: int = 5, link_density: int = 10,
+                 page_size: int = 4000, js_fraction: float = 0.0, relevant_fraction: float = 0.2,
+                 seed: int = 42):
+        """
+        Args:
+            pages (int): Number of pages in the site
+            fanout (int): Child pages linked from each page (the crawlable tree)
+            link_density (int): Extra links per page to random other pages
+            page_size (int): Approximate visible text per page, in bytes
+            js_fraction (float): Share of pages rendered client-side (needs the browser)
+            relevant_fraction (float): Share of pages about the benchmark topic
+            seed (int): Random seed, so runs are comparable
+        """
+
+
+        self.pages = pages
+        self.fanout = fanout
+        self.link_density = link_density
+        self.page_size = page_size
+        rng = random.Random(seed)
+        self.js_pages = {i for i in range(1, pages) if rng.random() < js_fraction}
+        self.relevant_pages = {i for i in range(pages) if rng.random() < relevant_fraction}
+        self.extra_links = {
+            i: [rng.randrange(pages) for _ in range(link_density)] for i in range(pages)
+        }
+        self.seed = seed
+
+    def page_links(self, i: int) -> List[int]:
+        children = range(i * self.fanout + 1, min(self.pages, i * self.fanout + self.fanout + 1))
+        return list(children) + self.extra_links[i]
+
+    def page_text(self, i: int) -> str:
+        rng = random.Random(self.seed * 100_003 + i)
+        vocabulary = FILLER_WORDS + (TOPIC_WORDS if i in self.relevant_pages else ())
+        words = []
+        size = 0
+        while size < self.page_size:
+            word = rng.choice(vocabulary)
+            words.append(word)
+            size += len(word) + 1
+        return ' '.join(words)
+
+    def anchor_text(self, j: int) -> str:
+        # Links to topic pages mention the topic, as navigation on real sites usually does
+        rng = random.Random(j)
+        words = rng.sample(FILLER_WORDS, 2)
+        if j in self.relevant_pages:
+            words[0] = rng.choice(TOPIC_WORDS)
+        return f'{" ".join(words)} {j}'
+
+    def render(self, i: int) -> str:
+        """
+        HTML for page i, server-rendered or as an empty SPA shell filled in by a script.
+        """
+
+
+        anchors = ''.join(
+            f'<li><a href="/page/{j}">{self.anchor_text(j)}</a></li>' for j in self.page_links(i)
+        )
+        body = (
+            f'{SITE_HEADER}<main><h1>Page {i}</h1><p>{self.page_text(i)}</p></main>'
+            f'<nav><ul>{anchors}</ul></nav>{SITE_FOOTER}'
+        )
+        if i in self.js_pages:
+            return (
+                f'<html><head><title>Page {i}</title></head><body><div id="root"></div>'
+                f'<script>document.getElementById("root").innerHTML = {json.dumps(body)};</script>'
+                f'</body></html>'
+            )
+        return f'<html><head><title>Page {i}</title></head><body>{body}</body></html>'
+
+def make_site_handler(site: SyntheticSite):
+    class SiteHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            match = re.fullmatch(r'/(?:page/(\d+))?', self.path)
+            index = int(match.group(1) or 0) if match else -1
+            if not 0 <= index < site.pages:
+                self.send_error(404)
+                return
+            payload = site.render(index).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    return SiteHandler
+
+class MockLLM:
+    """
+    Answers OpenAI chat-completions requests locally with a fixed latency, deciding by prompt type.
+    """
+
+    def __init__(self, latency: float = 0.2, follow_rate: float = 0.6):
+        """
+        Args:
+            latency (float): Seconds each completion takes
+            follow_rate (float): Share of links the mock tells the crawler to follow
+        """
+
+
+        self.latency = latency
+        self.follow_rate = follow_rate
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def follow(self, url: str) -> bool:
+        bucket = int(hashlib.md5(url.encode('utf-8')).hexdigest(), 16) % 100
+        return bucket < self.follow_rate * 100
+
+    def answer(self, system: str, prompt: str) -> str:
+        if 'semantic analysis' in system:
+            return ', '.join(TOPIC_WORDS)
+        if 'content relevance' in system:
+            content = prompt.split('Content (excerpt):', 1)[-1]
+            return 'TRUE' if any(word in content for word in TOPIC_WORDS[:2]) else 'FALSE'
+        if 'JSON array' in system:
+            links = re.findall(r'^\s*(\d+)\. Text: .*? \| URL: (\S+)', prompt, re.M)
+            return json.dumps([
+                {'id': int(i), 'follow': self.follow(url), 'score': 0.9 if self.follow(url) else 0.1}
+                for i, url in links
+            ])
+        url = re.search(r'- URL: (\S+)', prompt)
+        return 'TRUE' if url and self.follow(url.group(1)) else 'FALSE'
+
+    def handler(self):
+        llm = self
+
+        class LLMHandler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                messages = request['messages']
+                system = next((m['content'] for m in messages if m['role'] == 'system'), '')
+                prompt = messages[-1]['content']
+                time.sleep(llm.latency)
+                with llm.lock:
+                    llm.calls += 1
+                content = llm.answer(system, prompt)
+                prompt_tokens = sum(len(m['content']) for m in messages) // 4
+                completion_tokens = len(content) // 4 + 1
+                payload = json.dumps({
+                    'id': f'mock-{llm.calls}',
+                    'object': 'chat.completion',
+                    'created': int(time.time()),
+                    'model': request['model'],
+                    'choices': [{
+                        'index': 0,
+                        'message': {'role': 'assistant', 'content': content},
+                        'finish_reason': 'stop'
+                    }],
+                    'usage': {
+                        'prompt_tokens': prompt_tokens,
+                        'completion_tokens': completion_tokens,
+                        'total_tokens': prompt_tokens + completion_tokens
+                    }
+                }).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        return LLMHandler
+
+def serve(handler) -> ThreadingHTTPServer:
+    """
+    Start an HTTP server on a free local port in a daemon thread.
+    """
+
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+async def run_benchmark(site: SyntheticSite, llm: MockLLM, concurrency: int = 4,
+                        max_depth: int = 10, rufus_options: Dict[str, Any] = None, 
+                        crawl_options: Dict[str, Any] = None, 
+                        trace_memory: bool = False) -> Dict[str, Any]:
+    """
+    Crawl the synthetic site against the mock LLM and report throughput, LLM usage and memory.
+    
+    Args:
+        trace_memory (bool): Also report peak Python heap via tracemalloc; this slows the crawl
+            several times over, so timings from such a run are not comparable
+    """
+
+
+    site_server = serve(make_site_handler(site))
+    llm_server = serve(llm.handler())
+    base_url = f'http://127.0.0.1:{site_server.server_address[1]}/'
+    llm_url = f'http://127.0.0.1:{llm_server.server_address[1]}/v1'
+    workdir = tempfile.mkdtemp(prefix='rufus_bench_')
+    cwd = os.getcwd()
+
+    try:
+        os.chdir(workdir)
+        crawler = Rufus('benchmark', llm_base_url=llm_url, cache_path=None, **(rufus_options or {}))
+        if trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        await crawler.crawl(
+            base_url, 'employee benefits and hiring', max_depth=max_depth,
+            concurrency=concurrency, **(crawl_options or {})
+        )
+        elapsed = time.perf_counter() - start
+        peak_bytes = None
+        if trace_memory:
+            _, peak_bytes = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        await crawler.close()
+    finally:
+        os.chdir(cwd)
+        site_server.shutdown()
+        llm_server.shutdown()
+
+    pages = crawler.pages_crawled
+    performance = crawler.metrics.report()
+    return {
+        'site': {
+            'pages': site.pages,
+            'fanout': site.fanout,
+            'link_density': site.link_density,
+            'page_size': site.page_size,
+            'js_pages': len(site.js_pages)
+        },
+        'llm_latency_seconds': llm.latency,
+        'concurrency': concurrency,
+        'pages_crawled': pages,
+        # Share of the site reached; throughput figures from a collapsed crawl mean little
+        'coverage': round(pages / site.pages, 3),
+        'relevant_pages': sum(1 for v in crawler.page_relevance.values() if v),
+        'elapsed_seconds': round(elapsed, 2),
+        'pages_per_second': round(pages / elapsed, 2) if elapsed else 0.0,
+        'llm_calls': llm.calls,
+        'llm_calls_per_page': round(llm.calls / pages, 2) if pages else 0.0,
+        'python_peak_mb': round(peak_bytes / 1_000_000, 1) if peak_bytes is not None else None,
+        # ru_maxrss is reported in kilobytes on Linux
+        'max_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1000, 1),
+        'fetch_paths': crawler.http_fast_path.stats() if crawler.http_fast_path else None,
+        'boilerplate': crawler.template_learner.stats() if crawler.template_learner else None,
+        'stage_p95_ms': {stage: stats['p95_ms'] for stage, stats in performance.items()},
+        'output_dir': workdir
+    }
+
+def main():
+    """
+    Command-line entry point for the offline benchmark.
+    """
+    parser = argparse.ArgumentParser(description="Benchmark Rufus offline against a synthetic site and mock LLM")
+    parser.add_argument('--pages', type=int, default=200)
+    parser.add_argument('--fanout', type=int, default=5)
+    parser.add_argument('--link-density', type=int, default=10)
+    parser.add_argument('--page-size', type=int, default=4000)
+    parser.add_argument('--js-fraction', type=float, default=0.0,
+                        help="Share of client-rendered pages; anything above 0 needs Chromium installed")
+    parser.add_argument('--relevant-fraction', type=float, default=0.2)
+    parser.add_argument('--llm-latency', type=float, default=0.2)
+    parser.add_argument('--follow-rate', type=float, default=0.6)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--max-depth', type=int, default=10)
+    parser.add_argument('--link-batch-size', type=int, default=25)
+    parser.add_argument('--no-prefilter', action='store_true',
+                        help="Send every link to the LLM instead of triaging locally first")
+    parser.add_argument('--content-mode', choices=('body', 'main'), default='body')
+    parser.add_argument('--trace-memory', action='store_true',
+                        help="Report peak Python heap with tracemalloc (distorts timings)")
+    parser.add_argument('--log-level', default='WARNING')
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(args.log_level)
+    site = SyntheticSite(
+        pages=args.pages, fanout=args.fanout, link_density=args.link_density,
+        page_size=args.page_size, js_fraction=args.js_fraction,
+        relevant_fraction=args.relevant_fraction
+    )
+    llm = MockLLM(latency=args.llm_latency, follow_rate=args.follow_rate)
+    rufus_options = {
+        'link_batch_size': args.link_batch_size,
+        'prefilter_links': not args.no_prefilter,
+        'content_mode': args.content_mode
+    }
+    report = asyncio.run(run_benchmark(
+        site, llm, args.concurrency, args.max_depth, rufus_options, trace_memory=args.trace_memory
+    ))
+    print(json.dumps(report, indent=2))
+    if report['coverage'] < MIN_COVERAGE:
+        logging.warning(
+            f"Only {report['coverage']:.0%} of the site was crawled; pages/sec and LLM calls/page "
+            f"do not reflect throughput at this coverage"
+        )
+
+if __name__ == "__main__":
+    main()
@@ -2,15 +2,31 @@ import nest_asyncio
 nest_asyncio.apply()
 
 import asyncio
+import contextlib
+import hashlib
+import itertools
 import json
+import math
+import random
 import re
-from urllib.parse import urljoin
+import sqlite3
+import threading
+import zlib
+from collections.abc import MutableMapping
+from fnmatch import fnmatch
+from html.parser import HTMLParser
+from urllib.parse import urljoin, urlsplit, urlunsplit, parse_qsl, urlencode
 import time
 import os
 from datetime import datetime
 import logging
-from typing import Dict, List, Set, Any
-from openai import OpenAI
+from typing import Dict, List, Set, Any, Optional, Tuple, Callable
+import httpx
+from openai import AsyncOpenAI, APIConnectionError
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
 from playwright.async_api import async_playwright
 
 # Configure logging
@@ -23,22 +39,2212 @@ logging.basicConfig(
     ]
 )
 
+# Collects every anchor's href, text and truncated parent text in one in-page call
+LINK_EXTRACTION_SCRIPT = """
+(anchors, maxContext) => anchors.map(a => {
+    const parent = a.parentElement;
+    return {
+        href: a.getAttribute('href'),
+        text: (a.innerText || '').trim(),
+        context: parent ? (parent.textContent || '').slice(0, maxContext) : ''
+    };
+})
+"""
+
+# Query parameters that only carry analytics/tracking state
+DEFAULT_TRACKING_PARAMS = (
+    'utm_*', 'gclid', 'dclid', 'fbclid', 'msclkid', 'mc_cid', 'mc_eid', '_ga', '_gl', 'yclid'
+)
+
+class UrlCanonicalizer:
+    """
+    Normalize URLs so trivially different spellings of a page map to one key.
+    """
+
+    def __init__(self, strip_fragment: bool = True, strip_trailing_slash: bool = True, 
+                 lowercase_host: bool = True, sort_query: bool = True, 
+                 strip_params: tuple = DEFAULT_TRACKING_PARAMS, strip_default_port: bool = True):
+        """
+        Configure canonicalization rules.
+        
+        Args:
+            strip_fragment (bool): Drop '#fragment' parts
+            strip_trailing_slash (bool): Drop a trailing '/' from non-root paths
+            lowercase_host (bool): Lowercase scheme and host
+            sort_query (bool): Sort query parameters by name
+            strip_params (tuple): Query parameter names (fnmatch patterns) to remove
+            strip_default_port (bool): Drop ':80' for http and ':443' for https
+        """
+        
+        
+        self.strip_fragment = strip_fragment
+        self.strip_trailing_slash = strip_trailing_slash
+        self.lowercase_host = lowercase_host
+        self.sort_query = sort_query
+        self.strip_params = tuple(strip_params)
+        self.strip_default_port = strip_default_port
+
+    def canonicalize(self, url: str) -> str:
+        """
+        Return the canonical form of an absolute URL.
+        """
+        
+        
+        parts = urlsplit(url.strip())
+        scheme, netloc, path, query, fragment = parts
+        
+        if self.lowercase_host:
+            scheme = scheme.lower()
+            netloc = netloc.lower()
+        if self.strip_default_port and parts.port is not None:
+            if (scheme, parts.port) in (('http', 80), ('https', 443)):
+                netloc = netloc.rsplit(':', 1)[0]
+        
+        if not path:
+            path = '/'
+        elif self.strip_trailing_slash and path != '/' and path.endswith('/'):
+            path = path.rstrip('/') or '/'
+        
+        params = [
+            (key, value) for key, value in parse_qsl(query, keep_blank_values=True)
+            if not any(fnmatch(key.lower(), pattern) for pattern in self.strip_params)
+        ]
+        if self.sort_query:
+            params.sort()
+        query = urlencode(params)
+        
+        if self.strip_fragment:
+            fragment = ''
+        
+        return urlunsplit((scheme, netloc, path, query, fragment))
+
+# Links that almost never carry content worth crawling, matched against the URL's path and query
+# below the crawl's base URL and against the anchor text
+DEFAULT_REJECT_PATTERNS = (
+    r'\b(log-?in|log-?out|sign-?in|sign-?up|password|my-?account)\b',
+    r'\b(privacy|cookies?|terms-of-(use|service)|accessibility-statement)\b',
+    r'\b(facebook|twitter|instagram|linkedin|youtube|tiktok|share)\b',
+    r'[?&](lang|language|locale)=',
+    r'^(español|中文|filipino|tiếng việt|русский|français|deutsch|한국어|日本語)$',
+    r'^mailto:|^tel:|^javascript:',
+)
+
+TOKEN_STOPWORDS = {
+    'the', 'and', 'for', 'with', 'this', 'that', 'from', 'are', 'our', 'your', 'you', 'www',
+    'http', 'https', 'html', 'htm', 'php', 'aspx', 'index', 'com', 'org', 'gov', 'net'
+}
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercase alphanumeric tokens with stopwords and single characters removed.
+    """
+    
+    
+    return [t for t in re.findall(r'[a-z0-9]+', text.lower()) if len(t) > 1 and t not in TOKEN_STOPWORDS]
+
+class LinkPrefilter:
+    """
+    Local BM25 link scoring that accepts or rejects clear-cut links and escalates the rest to the LLM.
+    """
+
+    def __init__(self, accept_threshold: float = 0.75, reject_threshold: Optional[float] = None, 
+                 reject_patterns: tuple = DEFAULT_REJECT_PATTERNS, k1: float = 1.2, b: float = 0.75, 
+                 saturation: float = 2.0):
+        """
+        Configure scoring thresholds.
+        
+        Args:
+            accept_threshold (float): Normalized score at or above which a link is followed without the LLM
+            reject_threshold (float): Normalized score at or below which a link is dropped without the LLM;
+                None (the default) sends low-scoring links to the LLM, since hub links such as
+                "Human Resources" often share no words with the instruction yet lead to relevant pages
+            reject_patterns (tuple): Regexes on the URL below the base URL, or on anchor text, that
+                always reject a link
+            k1 (float): BM25 term-frequency saturation
+            b (float): BM25 length normalization
+            saturation (float): Raw BM25 score that maps to 0.5 after normalization
+        """
+        
+        
+        self.accept_threshold = accept_threshold
+        self.reject_threshold = reject_threshold
+        self.reject_patterns = [re.compile(p, re.I) for p in reject_patterns]
+        self.k1 = k1
+        self.b = b
+        self.saturation = saturation
+        self.accepted = 0
+        self.rejected = 0
+        self.escalated = 0
+
+    @staticmethod
+    def link_tokens(link: Dict[str, str]) -> List[str]:
+        """
+        Tokens describing a link: URL path segments, anchor text and surrounding context.
+        """
+        
+        
+        path = urlsplit(link['url']).path
+        return tokenize(path) + tokenize(link['text']) + tokenize(link.get('context', ''))
+
+    def score_links(self, links: List[Dict[str, str]], instruction: str, 
+                    keywords: List[str]) -> Dict[str, float]:
+        """
+        Score links against the instruction and keywords with BM25 over the page's own links.
+        
+        Returns scores normalized to [0, 1) keyed by URL.
+        """
+        
+        
+        query = set(tokenize(' '.join(keywords) + ' ' + instruction))
+        docs = {link['url']: self.link_tokens(link) for link in links}
+        if not docs:
+            return {}
+        
+        avg_len = sum(len(tokens) for tokens in docs.values()) / len(docs) or 1.0
+        doc_freq: Dict[str, int] = {}
+        for tokens in docs.values():
+            for token in set(tokens) & query:
+                doc_freq[token] = doc_freq.get(token, 0) + 1
+        
+        n = len(docs)
+        scores = {}
+        for url, tokens in docs.items():
+            score = 0.0
+            for token in set(tokens) & query:
+                tf = tokens.count(token)
+                idf = math.log(1 + (n - doc_freq[token] + 0.5) / (doc_freq[token] + 0.5))
+                score += idf * tf * (self.k1 + 1) / (tf + self.k1 * (1 - self.b + self.b * len(tokens) / avg_len))
+            scores[url] = score / (score + self.saturation)
+        return scores
+
+    @staticmethod
+    def relative_target(url: str, base_url: Optional[str] = None) -> str:
+        """
+        The part of a URL reject patterns see: path and query below base_url, never the host.
+        """
+        
+        
+        if base_url and url.startswith(base_url):
+            return url[len(base_url):]
+        parts = urlsplit(url)
+        if parts.scheme in ('http', 'https'):
+            return urlunsplit(('', '', parts.path, parts.query, ''))
+        return url
+
+    def triage(self, links: List[Dict[str, str]], instruction: str, keywords: List[str], 
+               scores: Optional[Dict[str, float]] = None, 
+               base_url: Optional[str] = None) -> Dict[str, str]:
+        """
+        Split links into 'accept', 'reject' and 'escalate' decisions keyed by URL.
+        
+        Args:
+            scores (Dict[str, float]): Precomputed score_links output, to avoid scoring twice
+            base_url (str): Crawl scope prefix, stripped before matching reject patterns so a
+                scope like https://x.gov/accounts/ does not reject every link
+        """
+        
+        
+        if scores is None:
+            scores = self.score_links(links, instruction, keywords)
+        has_query = bool(tokenize(' '.join(keywords) + ' ' + instruction))
+        decisions = {}
+        for link in links:
+            url = link['url']
+            target = self.relative_target(url, base_url)
+            if any(p.search(target) or p.search(link['text'].strip()) for p in self.reject_patterns):
+                decisions[url] = 'reject'
+            elif not has_query:
+                decisions[url] = 'escalate'
+            elif scores[url] >= self.accept_threshold:
+                decisions[url] = 'accept'
+            elif self.reject_threshold is not None and scores[url] <= self.reject_threshold:
+                decisions[url] = 'reject'
+            else:
+                decisions[url] = 'escalate'
+        
+        for decision in decisions.values():
+            if decision == 'accept':
+                self.accepted += 1
+            elif decision == 'reject':
+                self.rejected += 1
+            else:
+                self.escalated += 1
+        return decisions
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Decision counts and the share of links escalated to the LLM.
+        """
+        
+        
+        total = self.accepted + self.rejected + self.escalated
+        return {
+            'accepted': self.accepted,
+            'rejected': self.rejected,
+            'escalated': self.escalated,
+            'escalation_rate': round(self.escalated / total, 4) if total else 0.0
+        }
+
+# Third-party analytics, ad and tracking hosts that never contribute page text
+DEFAULT_BLOCKED_DOMAINS = (
+    'google-analytics.com', 'googletagmanager.com', 'doubleclick.net', 'googlesyndication.com',
+    'facebook.net', 'connect.facebook.net', 'hotjar.com', 'segment.io', 'segment.com',
+    'newrelic.com', 'nr-data.net', 'optimizely.com', 'siteimprove.com', 'siteimproveanalytics.com',
+    'clarity.ms', 'quantserve.com', 'scorecardresearch.com', 'addthis.com', 'sharethis.com'
+)
+
+# Rough median transfer sizes used to estimate bytes saved by aborted requests
+TYPICAL_RESOURCE_BYTES = {
+    'image': 40_000,
+    'media': 500_000,
+    'font': 30_000,
+    'stylesheet': 15_000,
+    'script': 25_000,
+    'other': 5_000
+}
+
+class ResourceBlocker:
+    """
+    Request-interception profile that aborts resources the crawler never reads.
+    """
+
+    def __init__(self, blocked_resource_types: tuple = ('image', 'media', 'font'), 
+                 blocked_domains: tuple = DEFAULT_BLOCKED_DOMAINS, 
+                 allowed_domains: Optional[tuple] = None):
+        """
+        Configure what gets blocked.
+        
+        Args:
+            blocked_resource_types (tuple): Playwright resource types to abort. Stylesheets are not
+                blocked by default because inner_text depends on CSS visibility.
+            blocked_domains (tuple): Hosts (and their subdomains) whose requests are aborted
+            allowed_domains (tuple): If set, only requests to these hosts (and subdomains) may load
+        """
+        
+        
+        self.blocked_resource_types = set(blocked_resource_types)
+        self.blocked_domains = tuple(blocked_domains)
+        self.allowed_domains = tuple(allowed_domains) if allowed_domains is not None else None
+        self.allowed_requests = 0
+        self.blocked_requests: Dict[str, int] = {}
+        self.estimated_bytes_saved = 0
+
+    @staticmethod
+    def host_matches(host: str, domains: tuple) -> bool:
+        return any(host == d or host.endswith('.' + d) for d in domains)
+
+    def should_block(self, url: str, resource_type: str) -> bool:
+        """
+        Decide whether a request should be aborted.
+        """
+        
+        
+        if resource_type == 'document':
+            return False
+        host = (urlsplit(url).hostname or '').lower()
+        if resource_type in self.blocked_resource_types:
+            return True
+        if self.host_matches(host, self.blocked_domains):
+            return True
+        if self.allowed_domains is not None and not self.host_matches(host, self.allowed_domains):
+            return True
+        return False
+
+    async def handle_route(self, route):
+        request = route.request
+        if self.should_block(request.url, request.resource_type):
+            self.blocked_requests[request.resource_type] = self.blocked_requests.get(request.resource_type, 0) + 1
+            self.estimated_bytes_saved += TYPICAL_RESOURCE_BYTES.get(
+                request.resource_type, TYPICAL_RESOURCE_BYTES['other']
+            )
+            await route.abort()
+        else:
+            self.allowed_requests += 1
+            await route.continue_()
+
+    async def install(self, page):
+        """
+        Start intercepting all requests made by a page.
+        """
+        
+        
+        await page.route('**/*', self.handle_route)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Allowed/blocked request counts and the estimated bytes saved.
+        """
+        
+        
+        return {
+            'allowed_requests': self.allowed_requests,
+            'blocked_requests': sum(self.blocked_requests.values()),
+            'blocked_by_type': dict(self.blocked_requests),
+            'estimated_bytes_saved': self.estimated_bytes_saved
+        }
+
+# Resolves once the DOM has stopped mutating for quietMs (capped at maxMs); pages without
+# scripts are treated as static and resolve immediately after DOMContentLoaded
+READINESS_SCRIPT = """
+({quietMs, maxMs}) => new Promise(resolve => {
+    const scripts = Array.from(document.scripts).filter(s => !s.type || /javascript|module/.test(s.type));
+    if (scripts.length === 0) {
+        resolve({strategy: 'domcontentloaded', waited_ms: 0, mutations: 0, capped: false});
+        return;
+    }
+    const start = performance.now();
+    let last = start;
+    let mutations = 0;
+    const observer = new MutationObserver(records => {
+        mutations += records.length;
+        last = performance.now();
+    });
+    observer.observe(document.documentElement, {childList: true, subtree: true, characterData: true});
+    const tick = () => {
+        const now = performance.now();
+        const capped = now - start >= maxMs;
+        if (capped || now - last >= quietMs) {
+            observer.disconnect();
+            resolve({strategy: 'quiescence', waited_ms: Math.round(now - start), mutations, capped});
+        } else {
+            setTimeout(tick, 50);
+        }
+    };
+    setTimeout(tick, 50);
+})
+"""
+
+class PageReadiness:
+    """
+    Decide when a navigated page is ready to read, instead of networkidle plus a fixed sleep.
+    """
+
+    def __init__(self, quiet_ms: int = 500, max_settle_ms: int = 5000, page_timeout: float = 30.0):
+        """
+        Configure readiness detection.
+        
+        Args:
+            quiet_ms (int): Milliseconds without DOM mutations after which the page counts as settled
+            max_settle_ms (int): Cap on the time spent waiting for the DOM to settle
+            page_timeout (float): Hard budget in seconds for navigation plus settling
+        """
+        
+        
+        self.quiet_ms = quiet_ms
+        self.max_settle_ms = max_settle_ms
+        self.page_timeout = page_timeout
+
+    async def load(self, page, url: str) -> Dict[str, Any]:
+        """
+        Navigate to a URL and wait until its text has stabilised.
+        
+        Returns a record of the wait strategy used and how long it took.
+        """
+        
+        
+        start = time.perf_counter()
+        
+        async def navigate_and_settle():
+            await page.goto(url, wait_until='domcontentloaded', timeout=self.page_timeout * 1000)
+            return await page.evaluate(
+                READINESS_SCRIPT, {'quietMs': self.quiet_ms, 'maxMs': self.max_settle_ms}
+            )
+        
+        record = await asyncio.wait_for(navigate_and_settle(), timeout=self.page_timeout)
+        record['load_ms'] = round((time.perf_counter() - start) * 1000)
+        return record
+
+# Paragraph-like elements whose text credits their ancestors in density scoring
+PARAGRAPH_TAGS = {'p', 'pre', 'td', 'blockquote'}
+MIN_PARAGRAPH_CHARS = 25
+HEADING_TAGS = {'h1', 'h2', 'h3'}
+
+# Returns the page text and headings, of the whole body or only of the main content region:
+# a <main>/role=main landmark, else the longest <article>, else the element with the most
+# paragraph text (credited to parent and half to grandparent) discounted by its link density
+CONTENT_EXTRACTION_SCRIPT = """
+(mode) => {
+    const body = document.body || document.documentElement;
+    const textOf = el => (el.innerText || '').trim();
+    const findMain = () => {
+        const landmark = document.querySelector('main, [role="main"]');
+        if (landmark && textOf(landmark)) return [landmark, 'landmark'];
+        const articles = Array.from(document.querySelectorAll('article')).filter(a => textOf(a));
+        if (articles.length) {
+            return [articles.reduce((a, b) => textOf(b).length > textOf(a).length ? b : a), 'article'];
+        }
+        const scores = new Map();
+        for (const p of document.querySelectorAll('p, pre, td, blockquote')) {
+            const length = textOf(p).length;
+            const parent = p.parentElement;
+            if (length < 25 || !parent) continue;
+            scores.set(parent, (scores.get(parent) || 0) + length);
+            if (parent.parentElement) {
+                scores.set(parent.parentElement, (scores.get(parent.parentElement) || 0) + length / 2);
+            }
+        }
+        let best = null;
+        let bestScore = 0;
+        for (const [el, score] of scores) {
+            const length = textOf(el).length || 1;
+            const linkLength = Array.from(el.querySelectorAll('a')).reduce((n, a) => n + textOf(a).length, 0);
+            const adjusted = score * (1 - Math.min(1, linkLength / length));
+            if (adjusted > bestScore) {
+                best = el;
+                bestScore = adjusted;
+            }
+        }
+        return best ? [best, 'density'] : [body, 'body'];
+    };
+    const [root, region] = mode === 'main' ? findMain() : [body, 'body'];
+    return {
+        text: root.innerText || '',
+        headings: Array.from(root.querySelectorAll('h1, h2, h3')).map(textOf).filter(Boolean),
+        region
+    };
+}
+"""
+
+BLOCK_TAGS = {
+    'address', 'article', 'aside', 'blockquote', 'br', 'dd', 'div', 'dl', 'dt', 'fieldset',
+    'figcaption', 'figure', 'footer', 'form', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'header', 'hr',
+    'li', 'main', 'nav', 'ol', 'p', 'pre', 'section', 'table', 'td', 'th', 'tr', 'ul'
+}
+SKIPPED_TAGS = {'head', 'script', 'style', 'noscript', 'template', 'svg', 'iframe'}
+VOID_TAGS = {
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'source', 'track', 'wbr'
+}
+
+class HTMLPageParser(HTMLParser):
+    """
+    Single-pass extraction of title, visible text and anchors from server-rendered HTML.
+    
+    Produces the same shapes as the browser path: text close to inner_text('body') and links
+    with 'href', 'text' and 'context' (the parent element's text, truncated). Also locates the
+    main content region the same way CONTENT_EXTRACTION_SCRIPT does, as a range of text chunks.
+    """
+
+    def __init__(self, max_context_chars: int = 200):
+        super().__init__(convert_charrefs=True)
+        self.max_context_chars = max_context_chars
+        self.chunks: List[str] = []
+        self.title_parts: List[str] = []
+        self.noscript_parts: List[str] = []
+        self.links: List[Dict[str, str]] = []
+        # Open elements as [tag, chunk index at open, anchors whose context this element provides,
+        # own link or None, text chars at open, link chars at open, density score, is main landmark]
+        self.stack: List[list] = []
+        self.skip_depth = 0
+        self.in_title = False
+        self.in_noscript = False
+        self.text_chars = 0
+        self.link_chars = 0
+        self.anchor_depth = 0
+        # Candidate main content regions as (start, end) chunk ranges
+        self.landmark_region: Optional[Tuple[int, int]] = None
+        self.articles: List[Tuple[int, int, int]] = []
+        self.dense_region: Optional[Tuple[int, int]] = None
+        self.dense_score = 0.0
+        self.heading_chunks: List[Tuple[int, str]] = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'title':
+            self.in_title = True
+        if tag == 'noscript':
+            self.in_noscript = True
+        if tag in SKIPPED_TAGS:
+            self.skip_depth += 1
+            return
+        if self.skip_depth:
+            return
+        if tag in BLOCK_TAGS:
+            self.chunks.append('\n')
+        if tag in VOID_TAGS:
+            return
+        
+        attributes = dict(attrs)
+        entry = [
+            tag, len(self.chunks), [], None, self.text_chars, self.link_chars, 0.0,
+            tag == 'main' or attributes.get('role') == 'main'
+        ]
+        if tag == 'a':
+            self.anchor_depth += 1
+            href = attributes.get('href')
+            if href is not None:
+                link = {'href': href, 'text': '', 'context': ''}
+                self.links.append(link)
+                entry[3] = link
+                if self.stack:
+                    self.stack[-1][2].append(link)
+        self.stack.append(entry)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_TAGS and tag not in SKIPPED_TAGS:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if tag == 'title':
+            self.in_title = False
+        if tag == 'noscript':
+            self.in_noscript = False
+        if tag in SKIPPED_TAGS:
+            self.skip_depth = max(0, self.skip_depth - 1)
+            return
+        if self.skip_depth:
+            return
+        
+        # Tolerate unclosed elements by popping up to the matching open tag
+        if any(entry[0] == tag for entry in self.stack):
+            while self.stack:
+                entry = self.stack.pop()
+                self.close_element(entry)
+                if entry[0] == tag:
+                    break
+        if tag in BLOCK_TAGS:
+            self.chunks.append('\n')
+
+    def handle_data(self, data):
+        if self.in_title:
+            self.title_parts.append(data)
+        elif self.in_noscript:
+            self.noscript_parts.append(data)
+        if self.skip_depth:
+            return
+        chunk = re.sub(r'\s+', ' ', data)
+        self.chunks.append(chunk)
+        self.text_chars += len(chunk.strip())
+        if self.anchor_depth:
+            self.link_chars += len(chunk.strip())
+
+    def close_element(self, entry):
+        tag, start, children = entry[0], entry[1], entry[2]
+        if children:
+            text = ' '.join(''.join(self.chunks[start:]).split())
+            for link in children:
+                link['context'] = text[:self.max_context_chars]
+        if tag == 'a':
+            self.anchor_depth = max(0, self.anchor_depth - 1)
+            if entry[3] is not None:
+                entry[3]['text'] = ' '.join(''.join(self.chunks[start:]).split())
+        
+        region = (start, len(self.chunks))
+        chars = self.text_chars - entry[4]
+        if tag in HEADING_TAGS:
+            heading = ' '.join(''.join(self.chunks[start:]).split())
+            if heading:
+                self.heading_chunks.append((start, heading))
+        if entry[7] and chars and self.landmark_region is None:
+            self.landmark_region = region
+        if tag == 'article' and chars:
+            self.articles.append((chars, start, region[1]))
+        if tag in PARAGRAPH_TAGS and chars >= MIN_PARAGRAPH_CHARS and self.stack:
+            self.stack[-1][6] += chars
+            if len(self.stack) > 1:
+                self.stack[-2][6] += chars / 2
+        if entry[6]:
+            link_density = min(1.0, (self.link_chars - entry[5]) / (chars or 1))
+            score = entry[6] * (1 - link_density)
+            if score > self.dense_score:
+                self.dense_score = score
+                self.dense_region = region
+
+    def close(self):
+        super().close()
+        while self.stack:
+            self.close_element(self.stack.pop())
+
+    @property
+    def title(self) -> str:
+        return ' '.join(''.join(self.title_parts).split())
+
+    def region_text(self, region: Optional[Tuple[int, int]] = None) -> str:
+        chunks = self.chunks[region[0]:region[1]] if region else self.chunks
+        lines = (' '.join(line.split()) for line in ''.join(chunks).split('\n'))
+        return '\n'.join(line for line in lines if line)
+
+    def region_headings(self, region: Optional[Tuple[int, int]] = None) -> List[str]:
+        return [
+            heading for start, heading in sorted(self.heading_chunks)
+            if region is None or region[0] <= start < region[1]
+        ]
+
+    @property
+    def text(self) -> str:
+        return self.region_text()
+
+    @property
+    def main_region(self) -> Tuple[Optional[Tuple[int, int]], str]:
+        """
+        The main content chunk range and how it was found; (None, 'body') if nothing stood out.
+        """
+        
+        
+        if self.landmark_region:
+            return self.landmark_region, 'landmark'
+        if self.articles:
+            _, start, end = max(self.articles)
+            return (start, end), 'article'
+        if self.dense_region:
+            return self.dense_region, 'density'
+        return None, 'body'
+
+    @property
+    def noscript_text(self) -> str:
+        return ' '.join(''.join(self.noscript_parts).split())
+
+# Empty mount points of client-side rendered apps
+SPA_ROOT_PATTERN = re.compile(
+    r'<(div|main|app-root)[^>]*\bid=["\'](root|app|__next|__nuxt|svelte|main-app)["\'][^>]*>\s*</\1>', re.I
+)
+NOSCRIPT_JS_PATTERN = re.compile(
+    r'(enable|turn on|requires?|need) (your )?javascript|javascript (is )?(required|disabled|must be enabled)', re.I
+)
+
+class PageSkipped(Exception):
+    """
+    Raised for responses that are not crawlable pages (client errors, non-HTML documents).
+    """
+
+class HttpFastPath:
+    """
+    Fetch pages over plain HTTP and parse them locally, deferring to the browser for JS-rendered pages.
+    """
+
+    def __init__(self, client: httpx.AsyncClient, min_text_chars: int = 200):
+        """
+        Args:
+            client (httpx.AsyncClient): Pooled HTTP client shared by all workers
+            min_text_chars (int): Pages with less visible text than this are re-rendered in the browser
+        """
+        
+        
+        self.client = client
+        self.min_text_chars = min_text_chars
+        self.http_pages = 0
+        self.browser_pages = 0
+        self.escalations: Dict[str, int] = {}
+        self.skipped: Dict[str, int] = {}
+
+    def skip_reason(self, response: httpx.Response) -> Optional[str]:
+        """
+        Return why a response is not a page worth crawling at all, in either path.
+        """
+        
+        
+        # A browser would get the same 404 and cannot navigate to downloads such as PDFs
+        if 400 <= response.status_code < 500:
+            return f'http_{response.status_code}'
+        if response.status_code < 400 and 'html' not in response.headers.get('content-type', 'text/html'):
+            return f"not_html:{response.headers['content-type'].split(';')[0].strip()}"
+        return None
+
+    def escalation_reason(self, response: httpx.Response, html: str, 
+                          parser: Optional[HTMLPageParser]) -> Optional[str]:
+        """
+        Return why a page needs the browser, or None if the HTTP result can be used as is.
+        """
+        
+        
+        if response.status_code >= 500:
+            return f'http_{response.status_code}'
+        if SPA_ROOT_PATTERN.search(html):
+            return 'spa_root'
+        if parser is not None and NOSCRIPT_JS_PATTERN.search(parser.noscript_text):
+            return 'noscript'
+        if parser is not None and len(parser.text) < self.min_text_chars:
+            return 'thin_body'
+        return None
+
+    async def fetch(self, url: str, 
+                    content_mode: str = 'body') -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+        """
+        Fetch and parse a page over HTTP.
+        
+        Args:
+            content_mode (str): 'body' for all visible text, 'main' for the main content region only
+        
+        Returns (snapshot, None) on success, or (None, reason) when the browser should render it.
+        Raises PageSkipped when the URL is not a crawlable page.
+        """
+        
+        
+        try:
+            response = await self.client.get(url)
+        except httpx.HTTPError as e:
+            return None, f'http_error:{type(e).__name__}'
+        
+        skip = self.skip_reason(response)
+        if skip:
+            self.skipped[skip.split(':')[0]] = self.skipped.get(skip.split(':')[0], 0) + 1
+            raise PageSkipped(skip)
+        
+        html = response.text if 'html' in response.headers.get('content-type', 'text/html') else ''
+        parser = None
+        if html:
+            parser = HTMLPageParser()
+            parser.feed(html)
+            parser.close()
+        
+        reason = self.escalation_reason(response, html, parser)
+        if reason:
+            return None, reason
+        region, strategy = parser.main_region if content_mode == 'main' else (None, 'body')
+        return {
+            'url': str(response.url),
+            'content': parser.region_text(region),
+            'title': parser.title,
+            'headings': parser.region_headings(region),
+            'region': strategy,
+            'links': parser.links,
+            'source': 'http'
+        }, None
+
+    def record(self, source: str, reason: Optional[str] = None):
+        if source == 'http':
+            self.http_pages += 1
+        else:
+            self.browser_pages += 1
+            if reason:
+                key = reason.split(':')[0]
+                self.escalations[key] = self.escalations.get(key, 0) + 1
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Pages served by each path, why pages were escalated to the browser and why URLs were skipped.
+        """
+        
+        
+        total = self.http_pages + self.browser_pages
+        return {
+            'http_pages': self.http_pages,
+            'browser_pages': self.browser_pages,
+            'http_ratio': round(self.http_pages / total, 4) if total else 0.0,
+            'escalations': dict(self.escalations),
+            'skipped': dict(self.skipped)
+        }
+
+class BrowserPool:
+    """
+    Long-lived Chromium whose pages are borrowed by crawls and recycled after N navigations.
+    
+    A single pool can be shared by several Rufus instances on the same event loop, so the browser
+    launch is paid once instead of per crawl. Concurrent crawls need one Rufus instance each:
+    an instance holds the state of the crawl it is running.
+    """
+
+    def __init__(self, headless: bool = True, max_pages: int = 8, recycle_after: int = 100):
+        """
+        Configure the pool.
+        
+        Args:
+            headless (bool): Launch Chromium without a window
+            max_pages (int): Maximum pages lent out at once across all borrowers
+            recycle_after (int): Navigations after which a page's context is closed and replaced
+        """
+        
+        
+        self.headless = headless
+        self.max_pages = max_pages
+        self.recycle_after = recycle_after
+        self.playwright = None
+        self.browser = None
+        self.idle: List[Any] = []
+        self.navigations: Dict[Any, int] = {}
+        self.semaphore = asyncio.Semaphore(max(1, max_pages))
+        self.start_lock = asyncio.Lock()
+        self.startup_seconds: Optional[float] = None
+        self.pages_created = 0
+        self.leases = 0
+        self.recycled = 0
+
+    async def start(self):
+        """
+        Launch the browser if it is not running yet.
+        """
+        
+        
+        async with self.start_lock:
+            if self.browser:
+                return
+            start = time.perf_counter()
+            self.playwright = await async_playwright().start()
+            self.browser = await self.playwright.chromium.launch(headless=self.headless)
+            self.startup_seconds = round(time.perf_counter() - start, 3)
+            logging.info(f"Browser pool started in {self.startup_seconds}s")
+
+    async def acquire(self):
+        """
+        Borrow a page, reusing an idle one when available.
+        """
+        
+        
+        await self.start()
+        await self.semaphore.acquire()
+        try:
+            self.leases += 1
+            if self.idle:
+                return self.idle.pop()
+            context = await self.browser.new_context()
+            page = await context.new_page()
+            self.navigations[page] = 0
+            self.pages_created += 1
+            return page
+        except Exception:
+            self.semaphore.release()
+            raise
+
+    async def release(self, page, navigations: int = 1, discard: bool = False):
+        """
+        Return a borrowed page, closing its context once it has served recycle_after navigations.
+        """
+        
+        
+        try:
+            self.navigations[page] = self.navigations.get(page, 0) + navigations
+            if discard or page.is_closed() or self.navigations[page] >= self.recycle_after:
+                self.navigations.pop(page, None)
+                self.recycled += 1
+                await page.context.close()
+            else:
+                # Drop per-crawl interception so the next borrower starts clean
+                await page.unroute('**/*')
+                self.idle.append(page)
+        except Exception as e:
+            self.navigations.pop(page, None)
+            logging.warning(f"Error returning page to browser pool: {str(e)}")
+        finally:
+            self.semaphore.release()
+
+    @contextlib.asynccontextmanager
+    async def page(self):
+        """
+        Borrow a page for one navigation; pages that raised are discarded rather than reused.
+        """
+        
+        
+        page = await self.acquire()
+        try:
+            yield page
+        except BaseException:
+            await self.release(page, discard=True)
+            raise
+        else:
+            await self.release(page)
+
+    async def close(self):
+        """
+        Close the browser and stop Playwright.
+        """
+        
+        
+        if self.browser:
+            await self.browser.close()
+        if self.playwright:
+            await self.playwright.stop()
+        self.browser = None
+        self.playwright = None
+        self.idle.clear()
+        self.navigations.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Browser startup time and page lease/recycle counts.
+        """
+        
+        
+        return {
+            'startup_seconds': self.startup_seconds,
+            'pages_created': self.pages_created,
+            'leases': self.leases,
+            'recycled_contexts': self.recycled
+        }
+
+class TemplateLearner:
+    """
+    Learns each site's page template from the text lines that repeat across its pages and strips
+    them (menus, banners, footers) from page content.
+    
+    A line counts as template once it has appeared on at least min_pages pages and on at least
+    min_share of the site's pages seen so far, so the first few pages of a site pass through unstripped.
+    """
+
+    def __init__(self, min_pages: int = 3, min_share: float = 0.5, max_lines: int = 200_000):
+        """
+        Args:
+            min_pages (int): Pages a line must appear on before it can be treated as template
+            min_share (float): Share of the site's pages a line must appear on
+            max_lines (int): Distinct lines tracked per site; lines seen only once are forgotten beyond this
+        """
+        
+        
+        self.min_pages = min_pages
+        self.min_share = min_share
+        self.max_lines = max_lines
+        # Per site: pages seen, and number of pages each line (by digest) appeared on
+        self.sites: Dict[str, Dict[str, Any]] = {}
+        self.chars_in = 0
+        self.chars_out = 0
+        self.lines_stripped = 0
+
+    @staticmethod
+    def line_key(line: str) -> bytes:
+        return hashlib.blake2b(line.encode('utf-8'), digest_size=8).digest()
+
+    def observe(self, site: Dict[str, Any], keys: Set[bytes]):
+        site['pages'] += 1
+        counts = site['lines']
+        for key in keys:
+            counts[key] = counts.get(key, 0) + 1
+        if len(counts) > self.max_lines:
+            site['lines'] = {key: count for key, count in counts.items() if count > 1}
+
+    def is_template(self, site: Dict[str, Any], key: bytes) -> bool:
+        count = site['lines'].get(key, 0)
+        return count >= self.min_pages and count >= self.min_share * site['pages']
+
+    def strip(self, url: str, text: str) -> str:
+        """
+        Record the page's lines for its site, then return its text without template lines.
+        """
+        
+        
+        site = self.sites.setdefault(urlsplit(url).netloc, {'pages': 0, 'lines': {}})
+        lines = [' '.join(line.split()) for line in text.split('\n')]
+        lines = [line for line in lines if line]
+        keys = [self.line_key(line) for line in lines]
+        self.observe(site, set(keys))
+        
+        kept = [line for line, key in zip(lines, keys) if not self.is_template(site, key)]
+        # A page made only of template lines (e.g. a bare landing page) is kept whole
+        stripped = '\n'.join(kept or lines)
+        self.chars_in += len(text)
+        self.chars_out += len(stripped)
+        self.lines_stripped += len(lines) - len(kept) if kept else 0
+        return stripped
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'sites': len(self.sites),
+            'lines_stripped': self.lines_stripped,
+            'chars_in': self.chars_in,
+            'chars_out': self.chars_out,
+            'reduction': round(1 - self.chars_out / self.chars_in, 3) if self.chars_in else 0.0
+        }
+
+class NearDuplicateIndex:
+    """
+    SimHash fingerprints of page text, banded so near-duplicates are found without comparing
+    against every page.
+    
+    The 64-bit fingerprint is split into hamming_threshold + 1 bands; two fingerprints within
+    the threshold must agree exactly on at least one band, so only pages sharing a band are compared.
+    """
+
+    def __init__(self, hamming_threshold: int = 3, shingle_size: int = 3, min_shingles: int = 20):
+        """
+        Args:
+            hamming_threshold (int): Maximum differing fingerprint bits for two pages to be near-duplicates
+            shingle_size (int): Words per shingle hashed into the fingerprint
+            min_shingles (int): Pages with fewer shingles are too short to fingerprint reliably
+        """
+        
+        
+        self.hamming_threshold = hamming_threshold
+        self.shingle_size = shingle_size
+        self.min_shingles = min_shingles
+        self.bands = hamming_threshold + 1
+        self.band_bits = 64 // self.bands
+        self.fingerprints: Dict[str, int] = {}
+        self.buckets: Dict[Tuple[int, int], List[str]] = {}
+        self.lookups = 0
+        self.matches = 0
+
+    def fingerprint(self, text: str) -> Optional[int]:
+        """
+        64-bit SimHash over word shingles, or None if the text is too short.
+        """
+        
+        
+        tokens = tokenize(text)
+        shingles = {
+            ' '.join(tokens[i:i + self.shingle_size])
+            for i in range(max(0, len(tokens) - self.shingle_size + 1))
+        }
+        if len(shingles) < self.min_shingles:
+            return None
+        weights = [0] * 64
+        for shingle in shingles:
+            value = int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'big')
+            for bit in range(64):
+                weights[bit] += 1 if value >> bit & 1 else -1
+        return sum(1 << bit for bit in range(64) if weights[bit] > 0)
+
+    def band_keys(self, fingerprint: int) -> List[Tuple[int, int]]:
+        mask = (1 << self.band_bits) - 1
+        return [(band, fingerprint >> (band * self.band_bits) & mask) for band in range(self.bands)]
+
+    def find(self, fingerprint: int) -> Optional[str]:
+        """
+        URL of the closest indexed page within the Hamming threshold, if any.
+        """
+        
+        
+        self.lookups += 1
+        best, best_distance = None, self.hamming_threshold + 1
+        for key in self.band_keys(fingerprint):
+            for url in self.buckets.get(key, ()):
+                distance = bin(fingerprint ^ self.fingerprints[url]).count('1')
+                if distance < best_distance:
+                    best, best_distance = url, distance
+        if best:
+            self.matches += 1
+        return best
+
+    def add(self, url: str, fingerprint: int):
+        if url in self.fingerprints:
+            return
+        self.fingerprints[url] = fingerprint
+        for key in self.band_keys(fingerprint):
+            self.buckets.setdefault(key, []).append(url)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'indexed_pages': len(self.fingerprints),
+            'lookups': self.lookups,
+            'near_duplicates': self.matches
+        }
+
+# Default model per LLM task; override per crawler with Rufus(models={...})
+DEFAULT_MODELS = {
+    'keywords': 'o1-mini',
+    'relevance': 'gpt-4o',
+    'link': 'gpt-4',
+    'link_batch': 'gpt-4'
+}
+
+class LLMBackend:
+    """
+    Interface for chat-completion providers used by Rufus.
+    
+    complete() returns a dict with 'content', 'prompt_tokens' and 'completion_tokens'.
+    """
+
+    name = 'backend'
+
+    async def complete(self, model: str, messages: List[Dict[str, str]], 
+                       temperature: float) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+class OpenAIBackend(LLMBackend):
+    """
+    OpenAI or any OpenAI-compatible server (vLLM, llama.cpp server, Ollama, LiteLLM, ...).
+    """
+
+    def __init__(self, api_key: Optional[str] = None, base_url: Optional[str] = None):
+        """
+        Args:
+            api_key (str): API key; None reads OPENAI_API_KEY, as the OpenAI SDK does
+            base_url (str): API base URL, e.g. 'http://localhost:8000/v1'; None for api.openai.com
+        """
+        
+        
+        if api_key is None and base_url and not os.environ.get('OPENAI_API_KEY'):
+            # Local servers ignore the key, but the SDK refuses to start without one
+            api_key = 'not-needed'
+        # Rufus retries itself (see RetryPolicy), so the SDK's own retries would only multiply attempts
+        self.client = AsyncOpenAI(api_key=api_key, base_url=base_url, max_retries=0)
+        self.name = base_url or 'openai'
+
+    async def complete(self, model: str, messages: List[Dict[str, str]], 
+                       temperature: float) -> Dict[str, Any]:
+        response = await self.client.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature
+        )
+        usage = response.usage
+        return {
+            'content': response.choices[0].message.content,
+            'prompt_tokens': usage.prompt_tokens if usage else 0,
+            'completion_tokens': usage.completion_tokens if usage else 0
+        }
+
+    async def close(self):
+        await self.client.close()
+
+class StubBackend(LLMBackend):
+    """
+    Offline backend answering from a fixed string or a function of (model, messages).
+    """
+
+    name = 'stub'
+
+    def __init__(self, responder: Any = 'TRUE'):
+        """
+        Args:
+            responder (str | Callable[[str, List[Dict[str, str]]], str]): Reply for every request
+        """
+        
+        
+        self.responder = responder
+        self.calls = 0
+
+    async def complete(self, model: str, messages: List[Dict[str, str]], 
+                       temperature: float) -> Dict[str, Any]:
+        self.calls += 1
+        content = self.responder(model, messages) if callable(self.responder) else self.responder
+        return {'content': content, 'prompt_tokens': 0, 'completion_tokens': 0}
+
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+class RetryPolicy:
+    """
+    Exponential backoff with full jitter for transient LLM failures.
+    """
+
+    def __init__(self, max_attempts: int = 4, base_delay: float = 1.0, max_delay: float = 30.0):
+        """
+        Args:
+            max_attempts (int): Attempts per request, including the first
+            base_delay (float): Backoff ceiling in seconds before the first retry; doubles per attempt
+            max_delay (float): Upper bound on any single backoff
+        """
+        
+        
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retries = 0
+
+    def is_retryable(self, error: Exception) -> bool:
+        """
+        Timeouts, connection errors, rate limiting and server errors are worth another attempt;
+        bad requests and authentication failures are not.
+        """
+        
+        
+        if isinstance(error, (APIConnectionError, asyncio.TimeoutError, ConnectionError)):
+            return True
+        return getattr(error, 'status_code', None) in RETRYABLE_STATUS_CODES
+
+    def delay(self, attempt: int) -> float:
+        # Full jitter spreads out workers that failed together so they don't retry in lockstep
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def stats(self) -> Dict[str, Any]:
+        return {'retries': self.retries}
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of calling a backend whose circuit breaker is open.
+    """
+
+class CircuitBreaker:
+    """
+    Stops calling a backend after repeated failures and probes it again after a cool-down.
+    
+    Closed: requests flow normally. Open: requests fail fast with CircuitOpenError. Half-open:
+    after reset_timeout one probe request is let through; its success closes the circuit again.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        """
+        Args:
+            failure_threshold (int): Consecutive failed requests that open the circuit
+            reset_timeout (float): Seconds the circuit stays open before a probe is allowed
+        """
+        
+        
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.probing = False
+        self.times_opened = 0
+        self.rejected_requests = 0
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half_open'
+        return 'open'
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == 'closed':
+            return True
+        if state == 'half_open' and not self.probing:
+            self.probing = True
+            return True
+        self.rejected_requests += 1
+        return False
+
+    def retry_after(self) -> float:
+        """
+        Seconds until the circuit will let a probe through (0 when closed).
+        """
+        
+        
+        if self.opened_at is None:
+            return 0.0
+        return max(0.0, self.opened_at + self.reset_timeout - time.monotonic())
+
+    def release_probe(self):
+        """
+        Give back the half-open probe slot when the probe ended without an outcome (e.g. cancelled).
+        """
+        
+        
+        self.probing = False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.probing or (self.opened_at is None and self.failures >= self.failure_threshold):
+            if self.opened_at is None:
+                self.times_opened += 1
+                logging.warning(f"Circuit opened after {self.failures} consecutive LLM failures")
+            self.opened_at = time.monotonic()
+        self.probing = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'state': self.state,
+            'times_opened': self.times_opened,
+            'rejected_requests': self.rejected_requests
+        }
+
+TOKEN_ENCODINGS: Dict[str, Any] = {}
+
+CHARS_PER_TOKEN = 4
+
+def token_encoding(model: str):
+    """
+    The model's tiktoken encoding, or None when tiktoken is not installed or cannot load it.
+    """
+    
+    
+    if tiktoken is None:
+        return None
+    if model not in TOKEN_ENCODINGS:
+        try:
+            try:
+                TOKEN_ENCODINGS[model] = tiktoken.encoding_for_model(model)
+            except KeyError:
+                TOKEN_ENCODINGS[model] = tiktoken.get_encoding('cl100k_base')
+        except Exception as e:
+            # e.g. offline without the BPE files cached: estimate instead of failing the page
+            logging.warning(f"No tiktoken encoding for {model}, estimating token counts: {str(e)}")
+            TOKEN_ENCODINGS[model] = None
+    return TOKEN_ENCODINGS[model]
+
+def estimate_tokens(text: str, model: str = 'gpt-4o') -> int:
+    """
+    Count tokens with tiktoken when it is installed, otherwise estimate at ~4 characters per token.
+    """
+    
+    
+    encoding = token_encoding(model)
+    if encoding is None:
+        return len(text) // CHARS_PER_TOKEN + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+def split_by_tokens(text: str, window_tokens: int, max_windows: Optional[int] = None, 
+                    model: str = 'gpt-4o') -> List[str]:
+    """
+    Cut text into consecutive windows of at most window_tokens tokens each.
+    
+    Args:
+        text (str): Text to split
+        window_tokens (int): Token budget per window
+        max_windows (int): Stop after this many windows; None keeps the whole text
+        model (str): Model whose tokenizer counts the tokens
+    """
+    
+    
+    window_tokens = max(1, window_tokens)
+    encoding = token_encoding(model)
+    if encoding is None:
+        # Without a tokenizer, fall back to the same ~4 characters per token as estimate_tokens
+        size = window_tokens * CHARS_PER_TOKEN
+        windows = [text[i:i + size] for i in range(0, len(text), size)]
+    else:
+        tokens = encoding.encode(text, disallowed_special=())
+        windows = [
+            encoding.decode(tokens[i:i + window_tokens]) for i in range(0, len(tokens), window_tokens)
+        ]
+    return (windows or [''])[:max_windows]
+
+class TokenBucket:
+    """
+    Continuously refilling bucket holding at most one minute's worth of capacity.
+    """
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.available = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.updated_at = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def wait_time(self, amount: float) -> float:
+        """
+        Seconds until amount can be taken (0 if it can be taken now).
+        """
+        
+        
+        self.refill()
+        amount = min(amount, self.capacity)
+        return max(0.0, (amount - self.available) / self.rate)
+
+    def take(self, amount: float):
+        self.refill()
+        # May go negative when actual usage exceeds the estimate; later requests wait off the debt
+        self.available -= amount
+
+class RateLimiter:
+    """
+    Per-model requests-per-minute and tokens-per-minute budgets shared by all concurrent calls.
+    
+    Callers that would exceed either limit wait in FIFO order instead of being sent and failing
+    with HTTP 429.
+    """
+
+    def __init__(self, limits: Dict[str, Dict[str, float]], default: Optional[Dict[str, float]] = None):
+        """
+        Args:
+            limits (Dict[str, Dict[str, float]]): Per model, {'rpm': ..., 'tpm': ...}; either may be omitted
+            default (Dict[str, float]): Limits for models not listed in limits; None leaves them unthrottled
+        """
+        
+        
+        self.limits = limits
+        self.default = default
+        self.buckets: Dict[str, Tuple[Optional[TokenBucket], Optional[TokenBucket]]] = {}
+        self.locks: Dict[str, asyncio.Lock] = {}
+        self.throttled_requests = 0
+        self.throttle_seconds = 0.0
+
+    def model_buckets(self, model: str) -> Tuple[Optional[TokenBucket], Optional[TokenBucket]]:
+        if model not in self.buckets:
+            limit = self.limits.get(model, self.default) or {}
+            self.buckets[model] = (
+                TokenBucket(limit['rpm']) if limit.get('rpm') else None,
+                TokenBucket(limit['tpm']) if limit.get('tpm') else None
+            )
+            self.locks[model] = asyncio.Lock()
+        return self.buckets[model]
+
+    async def acquire(self, model: str, tokens: int) -> float:
+        """
+        Wait until one request of the estimated size fits both budgets, then reserve it.
+        
+        Returns the seconds spent waiting.
+        """
+        
+        
+        requests, token_bucket = self.model_buckets(model)
+        if requests is None and token_bucket is None:
+            return 0.0
+        
+        waited = 0.0
+        # Holding the per-model lock while sleeping makes waiters queue in arrival order
+        async with self.locks[model]:
+            while True:
+                wait = max(
+                    requests.wait_time(1) if requests else 0.0,
+                    token_bucket.wait_time(tokens) if token_bucket else 0.0
+                )
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+                waited += wait
+            if requests:
+                requests.take(1)
+            if token_bucket:
+                token_bucket.take(tokens)
+        
+        if waited:
+            self.throttled_requests += 1
+            self.throttle_seconds += waited
+        return waited
+
+    def settle(self, model: str, estimated_tokens: int, actual_tokens: int):
+        """
+        Correct the token budget once the real usage of a request is known.
+        """
+        
+        
+        _, token_bucket = self.model_buckets(model)
+        if token_bucket and actual_tokens:
+            token_bucket.take(actual_tokens - estimated_tokens)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'throttled_requests': self.throttled_requests,
+            'throttle_wait_seconds': round(self.throttle_seconds, 2)
+        }
+
+class LLMCache:
+    """
+    On-disk cache of LLM completions keyed by model and normalized prompt fingerprint.
+    
+    Lookups read SQLite directly (WAL reads never wait on writers). New entries, access times
+    and expiries are buffered in memory and written in batches by flush() on a worker thread,
+    so the event loop never waits on a commit.
+    """
+
+    def __init__(self, path: str = 'llm_cache.sqlite', ttl_seconds: float = 7 * 24 * 3600, 
+                 max_entries: int = 100_000, flush_every: int = 50, evict_every: int = 1000):
+        """
+        Open (or create) the cache database.
+        
+        Args:
+            path (str): SQLite file holding cached responses
+            ttl_seconds (float): Age after which an entry is treated as a miss and dropped
+            max_entries (int): Entries kept before least-recently-used ones are evicted
+            flush_every (int): Buffered writes that trigger a flush
+            evict_every (int): New entries written between LRU eviction passes; the first flush of
+                every session also evicts and purges expired entries
+        """
+        
+        
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.flush_every = flush_every
+        self.evict_every = evict_every
+        self.hits = 0
+        self.misses = 0
+        self.flushes = 0
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS completions (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                response TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )"""
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_accessed_at ON completions (accessed_at)")
+        self.conn.commit()
+        # Batched writes go through their own connection; an in-memory database only has one
+        if path == ':memory:':
+            self.writer = self.conn
+        else:
+            self.writer = sqlite3.connect(path, check_same_thread=False)
+            self.writer.execute("PRAGMA synchronous=NORMAL")
+        self.write_lock = threading.Lock()
+        self.pending_puts: Dict[str, Tuple[str, str, float]] = {}
+        self.pending_access: Dict[str, float] = {}
+        self.pending_deletes: Set[str] = set()
+        # Entries handed to the writer thread but not yet committed; still served by get()
+        self.flushing_puts: Dict[str, Tuple[str, str, float]] = {}
+        self.flushing = False
+        self.puts_since_evict = 0
+        self.maintained = False
+
+    @staticmethod
+    def fingerprint(model: str, messages: List[Dict[str, str]], temperature: float) -> str:
+        """
+        Hash the model, temperature and whitespace-normalized messages into a cache key.
+        """
+        
+        
+        normalized = [
+            {'role': m['role'], 'content': ' '.join(m['content'].split())}
+            for m in messages
+        ]
+        payload = json.dumps(
+            {'model': model, 'temperature': temperature, 'messages': normalized},
+            sort_keys=True, ensure_ascii=False
+        )
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Return the cached response for a key, or None on a miss or expired entry.
+        """
+        
+        
+        now = time.time()
+        pending = self.pending_puts.get(key) or self.flushing_puts.get(key)
+        if pending is not None:
+            row = (pending[1], pending[2])
+        else:
+            row = self.conn.execute(
+                "SELECT response, created_at FROM completions WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None or now - row[1] > self.ttl_seconds:
+            if row is not None:
+                self.pending_deletes.add(key)
+                self.pending_puts.pop(key, None)
+            self.misses += 1
+            return None
+        
+        # Recency for LRU eviction is written with the next batch rather than committed per hit
+        self.pending_access[key] = now
+        self.hits += 1
+        return row[0]
+
+    def put(self, key: str, model: str, response: str):
+        """
+        Buffer a response for the next flush.
+        """
+        
+        
+        self.pending_puts[key] = (model, response, time.time())
+        self.pending_deletes.discard(key)
+
+    def needs_flush(self) -> bool:
+        return not self.flushing and len(self.pending_puts) + len(self.pending_access) >= self.flush_every
+
+    async def flush(self):
+        """
+        Write buffered entries, access times and expiries in one transaction off the event loop.
+        """
+        
+        
+        if self.flushing or not (self.pending_puts or self.pending_access or self.pending_deletes):
+            return
+        self.flushing = True
+        puts, access, deletes = self.pending_puts, self.pending_access, self.pending_deletes
+        self.pending_puts, self.pending_access, self.pending_deletes = {}, {}, set()
+        self.flushing_puts = puts
+        try:
+            await asyncio.to_thread(self.write, puts, access, deletes)
+        finally:
+            self.flushing_puts = {}
+            self.flushing = False
+
+    def write(self, puts: Dict[str, Tuple[str, str, float]], access: Dict[str, float], deletes: Set[str]):
+        with self.write_lock:
+            self.writer.executemany(
+                "INSERT OR REPLACE INTO completions VALUES (?, ?, ?, ?, ?)",
+                [(key, model, response, at, at) for key, (model, response, at) in puts.items()]
+            )
+            self.writer.executemany(
+                "UPDATE completions SET accessed_at = ? WHERE key = ?",
+                [(at, key) for key, at in access.items()]
+            )
+            self.writer.executemany("DELETE FROM completions WHERE key = ?", [(key,) for key in deletes])
+            self.puts_since_evict += len(puts)
+            # Periodically rather than per put, and once per session so many short crawls still evict
+            if not self.maintained or self.puts_since_evict >= self.evict_every:
+                self.evict()
+            self.writer.commit()
+            self.flushes += 1
+
+    def evict(self):
+        """
+        Drop expired entries and the least recently used ones beyond max_entries (writer thread).
+        """
+        
+        
+        self.writer.execute(
+            "DELETE FROM completions WHERE created_at < ?", (time.time() - self.ttl_seconds,)
+        )
+        self.writer.execute(
+            """DELETE FROM completions WHERE key IN (
+                SELECT key FROM completions ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+            )""",
+            (self.max_entries,)
+        )
+        self.puts_since_evict = 0
+        self.maintained = True
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Hit/miss counts for this session.
+        """
+        
+        
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            'flushes': self.flushes
+        }
+
+    def close(self):
+        # Leave the database within max_entries even if this session never reached evict_every
+        self.maintained = False
+        self.write(self.pending_puts, self.pending_access, self.pending_deletes)
+        self.pending_puts, self.pending_access, self.pending_deletes = {}, {}, set()
+        if self.writer is not self.conn:
+            self.writer.close()
+        self.conn.close()
+
+# USD per million (input, output) tokens, matched by longest model-name prefix
+MODEL_PRICING = {
+    'gpt-4o-mini': (0.15, 0.60),
+    'gpt-4o': (2.50, 10.00),
+    'gpt-4-turbo': (10.00, 30.00),
+    'gpt-4': (30.00, 60.00),
+    'gpt-3.5-turbo': (0.50, 1.50),
+    'o1-mini': (3.00, 12.00),
+    'o1': (15.00, 60.00)
+}
+
+class CrawlBudget:
+    """
+    Global stop conditions shared by all workers: pages, LLM tokens, estimated spend and wall time.
+    
+    Once any limit trips the budget stays exhausted, so workers stop taking new pages and the
+    crawl drains and saves what it has.
+    """
+
+    def __init__(self, max_pages: Optional[int] = None, max_tokens: Optional[int] = None, 
+                 max_cost_usd: Optional[float] = None, max_seconds: Optional[float] = None):
+        """
+        Args:
+            max_pages (int): Pages to crawl
+            max_tokens (int): Prompt plus completion tokens across all LLM calls
+            max_cost_usd (float): Estimated LLM spend, from MODEL_PRICING
+            max_seconds (float): Wall-clock time since the crawl started
+        """
+        
+        
+        self.max_pages = max_pages
+        self.max_tokens = max_tokens
+        self.max_cost_usd = max_cost_usd
+        self.max_seconds = max_seconds
+        self.tokens = 0
+        self.cost_usd = 0.0
+        self.started_at = time.monotonic()
+        self.exhausted_reason: Optional[str] = None
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
+
+    @staticmethod
+    def price(model: str) -> Tuple[float, float]:
+        matches = [name for name in MODEL_PRICING if model.startswith(name)]
+        return MODEL_PRICING[max(matches, key=len)] if matches else (0.0, 0.0)
+
+    def record_usage(self, model: str, prompt_tokens: int, completion_tokens: int):
+        """
+        Account for one completion's token usage and estimated cost.
+        """
+        
+        
+        input_price, output_price = self.price(model)
+        self.tokens += prompt_tokens + completion_tokens
+        self.cost_usd += (prompt_tokens * input_price + completion_tokens * output_price) / 1_000_000
+
+    def check(self, pages: int) -> Optional[str]:
+        """
+        Return the name of the first exhausted limit, or None while there is budget left.
+        """
+        
+        
+        if self.exhausted_reason:
+            return self.exhausted_reason
+        if self.max_pages is not None and pages >= self.max_pages:
+            self.exhausted_reason = 'max_pages'
+        elif self.max_tokens is not None and self.tokens >= self.max_tokens:
+            self.exhausted_reason = 'max_tokens'
+        elif self.max_cost_usd is not None and self.cost_usd >= self.max_cost_usd:
+            self.exhausted_reason = 'max_cost_usd'
+        elif self.max_seconds is not None and self.elapsed() >= self.max_seconds:
+            self.exhausted_reason = 'max_seconds'
+        if self.exhausted_reason:
+            logging.warning(f"Crawl budget exhausted ({self.exhausted_reason}); draining workers")
+        return self.exhausted_reason
+
+    def remaining(self, pages: int) -> Dict[str, Any]:
+        """
+        Budget left per limit; None for limits that are not set.
+        """
+        
+        
+        return {
+            'pages': self.max_pages - pages if self.max_pages is not None else None,
+            'tokens': self.max_tokens - self.tokens if self.max_tokens is not None else None,
+            'cost_usd': round(self.max_cost_usd - self.cost_usd, 4) if self.max_cost_usd is not None else None,
+            'seconds': round(self.max_seconds - self.elapsed(), 1) if self.max_seconds is not None else None
+        }
+
+    def stats(self, pages: int) -> Dict[str, Any]:
+        return {
+            'pages': pages,
+            'tokens': self.tokens,
+            'estimated_cost_usd': round(self.cost_usd, 4),
+            'elapsed_seconds': round(self.elapsed(), 1),
+            'remaining': self.remaining(pages),
+            'exhausted': self.exhausted_reason
+        }
+
+class CrawlMetrics:
+    """
+    Per-stage latency samples with percentile summaries and an optional export hook.
+    """
+
+    def __init__(self, hook: Optional[Callable[[str, float], None]] = None):
+        """
+        Args:
+            hook (Callable[[str, float], None]): Called with (stage, seconds) for every sample,
+                e.g. to forward timings to StatsD or Prometheus
+        """
+        
+        
+        self.hook = hook
+        self.samples: Dict[str, List[float]] = {}
+
+    def record(self, stage: str, seconds: float):
+        self.samples.setdefault(stage, []).append(seconds)
+        if self.hook:
+            try:
+                self.hook(stage, seconds)
+            except Exception as e:
+                logging.warning(f"Metrics hook failed for {stage}: {str(e)}")
+
+    @contextlib.contextmanager
+    def timer(self, stage: str):
+        """
+        Time the enclosed block (including any awaits inside it) as one sample of a stage.
+        """
+        
+        
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    @staticmethod
+    def percentile(ordered: List[float], pct: float) -> float:
+        # Nearest-rank percentile on already sorted samples
+        index = max(0, math.ceil(pct / 100 * len(ordered)) - 1)
+        return ordered[index]
+
+    def report(self) -> Dict[str, Dict[str, float]]:
+        """
+        Count, total, mean, p50/p95/p99 and max per stage, in milliseconds.
+        """
+        
+        
+        report = {}
+        for stage in sorted(self.samples):
+            ordered = sorted(self.samples[stage])
+            report[stage] = {
+                'count': len(ordered),
+                'total_ms': round(sum(ordered) * 1000, 1),
+                'mean_ms': round(sum(ordered) / len(ordered) * 1000, 1),
+                'p50_ms': round(self.percentile(ordered, 50) * 1000, 1),
+                'p95_ms': round(self.percentile(ordered, 95) * 1000, 1),
+                'p99_ms': round(self.percentile(ordered, 99) * 1000, 1),
+                'max_ms': round(ordered[-1] * 1000, 1)
+            }
+        return report
+
+class PageStore(MutableMapping):
+    """
+    Drop-in replacement for the page_data dict that keeps only page metadata in memory.
+    
+    Page content is zlib-compressed and written once per distinct text to a content-addressed
+    directory (files named by SHA-256), and read back transparently on access.
+    """
+
+    def __init__(self, directory: str, compression_level: int = 6):
+        """
+        Args:
+            directory (str): Directory holding the compressed content blobs
+            compression_level (int): zlib compression level
+        """
+        
+        
+        self.directory = directory
+        self.compression_level = compression_level
+        self.meta: Dict[str, Dict[str, Any]] = {}
+        self.refs: Dict[str, str] = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def blob_path(self, digest: str) -> str:
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def put_content(self, content: str) -> str:
+        """
+        Store content once and return its digest.
+        """
+        
+        
+        data = content.encode('utf-8')
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.blob_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f'{path}.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(zlib.compress(data, self.compression_level))
+            os.replace(tmp_path, path)
+        return digest
+
+    def get_content(self, digest: str) -> str:
+        with open(self.blob_path(digest), 'rb') as f:
+            return zlib.decompress(f.read()).decode('utf-8')
+
+    def __setitem__(self, url: str, record: Dict[str, Any]):
+        meta = dict(record)
+        self.refs[url] = self.put_content(meta.pop('content', ''))
+        self.meta[url] = meta
+
+    def __getitem__(self, url: str) -> Dict[str, Any]:
+        return {**self.meta[url], 'content': self.get_content(self.refs[url])}
+
+    def __delitem__(self, url: str):
+        del self.meta[url]
+        del self.refs[url]
+
+    def __iter__(self):
+        return iter(self.meta)
+
+    def __len__(self) -> int:
+        return len(self.meta)
+
+    def metadata(self, url: str) -> Dict[str, Any]:
+        """
+        Page metadata without touching the content store.
+        """
+        
+        
+        return dict(self.meta[url])
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Metadata and content references, for checkpoints.
+        """
+        
+        
+        return {'directory': self.directory, 'meta': dict(self.meta), 'refs': dict(self.refs)}
+
+    def restore(self, state: Dict[str, Any]):
+        self.meta = dict(state['meta'])
+        self.refs = dict(state['refs'])
+
+class JsonlResultSink:
+    """
+    Append-only JSON Lines writer: one record per relevant page, then a summary trailer.
+    
+    Every line is flushed as soon as it is written so downstream consumers can tail the file
+    while the crawl is still running.
+    """
+
+    def __init__(self, path: str, offset: Optional[int] = None):
+        """
+        Args:
+            path (str): Output file, appended to if it already exists
+            offset (Optional[int]): Byte length to truncate an existing file to before appending,
+                dropping records written after a checkpoint (and any summary trailer)
+        """
+        
+        
+        self.path = path
+        self.pages_written = 0
+        if offset is not None and os.path.exists(path):
+            with open(path, 'r+b') as f:
+                f.truncate(offset)
+        self.file = open(path, 'ab')
+        # End of the last page record; the trailer is never counted so a resume overwrites it
+        self.pages_end = self.file.seek(0, os.SEEK_END)
+
+    def write(self, record: Dict[str, Any]):
+        self.file.write((json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8'))
+        self.file.flush()
+
+    def write_page(self, page: Dict[str, Any]):
+        """
+        Append one relevant page record.
+        """
+        
+        
+        self.write({'type': 'page', **page})
+        self.pages_written += 1
+        self.pages_end = self.file.tell()
+
+    def write_trailer(self, summary: Dict[str, Any]):
+        """
+        Append the crawl summary (metadata, relevance map, depth analysis) as the last record.
+        """
+        
+        
+        self.write({'type': 'summary', **summary})
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+class CrawlCheckpoint:
+    """
+    Atomic on-disk snapshot of a crawl's frontier, visited set and collected results.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.saves = 0
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def load(self) -> Dict[str, Any]:
+        """
+        Read the last saved state.
+        """
+        
+        
+        with open(self.path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def write(self, state: Dict[str, Any]):
+        # Write to a temporary file first so a crash mid-write never corrupts the last checkpoint
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    async def save(self, state: Dict[str, Any]):
+        """
+        Persist a state snapshot without blocking the event loop.
+        """
+        
+        
+        await asyncio.to_thread(self.write, state)
+        self.saves += 1
+        logging.info(
+            f"Checkpoint saved to {self.path}: {len(state['visited_urls'])} visited, "
+            f"{len(state['frontier'])} pending"
+        )
+
 class Rufus:
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: Optional[str] = None, max_llm_concurrency: int = 8, link_batch_size: int = 25, 
+                 cache_path: Optional[str] = 'llm_cache.sqlite', cache_ttl: float = 7 * 24 * 3600, 
+                 cache_max_entries: int = 100_000, 
+                 canonicalizer: Optional[UrlCanonicalizer] = None, 
+                 link_prefilter: Optional[LinkPrefilter] = None, prefilter_links: bool = True, 
+                 page_store_dir: Optional[str] = None, 
+                 metrics_hook: Optional[Callable[[str, float], None]] = None, 
+                 llm_base_url: Optional[str] = None, backend: Optional[LLMBackend] = None, 
+                 models: Optional[Dict[str, str]] = None, 
+                 task_backends: Optional[Dict[str, LLMBackend]] = None, 
+                 rate_limits: Optional[Dict[str, Dict[str, float]]] = None, 
+                 default_rate_limit: Optional[Dict[str, float]] = None, 
+                 retry_policy: Optional[RetryPolicy] = None, circuit_failure_threshold: int = 5, 
+                 circuit_reset_timeout: float = 30.0, max_relevance_retries: int = 2, 
+                 relevance_window_tokens: int = 500, relevance_chunks: int = 1, 
+                 template_learner: Optional[TemplateLearner] = None, strip_boilerplate: bool = True, 
+                 content_mode: str = 'body', duplicate_index: Optional[NearDuplicateIndex] = None, 
+                 detect_duplicates: bool = True):
         """
         Initialize the semantic web crawler.
         
         Args:
-            api_key (str): OpenAI API key for semantic analysis
+            api_key (str): OpenAI API key for semantic analysis, used when no backend is given
+            max_llm_concurrency (int): Maximum number of LLM requests in flight at once
+            link_batch_size (int): Links classified per LLM request; 1 or less classifies links one by one
+            cache_path (str): SQLite file for the LLM response cache; None disables caching
+            cache_ttl (float): Seconds before a cached response expires
+            cache_max_entries (int): Maximum cached responses before LRU eviction
+            canonicalizer (UrlCanonicalizer): URL normalization rules applied before dedup
+            link_prefilter (LinkPrefilter): Local link scorer consulted before the LLM
+            prefilter_links (bool): Whether to triage links locally before LLM classification
+            page_store_dir (str): Spill page content to a compressed on-disk store in this directory
+                instead of keeping it in memory
+            metrics_hook (Callable[[str, float], None]): Receives every (stage, seconds) timing sample
+            llm_base_url (str): OpenAI-compatible API base URL, used when no backend is given
+            backend (LLMBackend): Default completion backend for all tasks
+            models (Dict[str, str]): Model per task ('keywords', 'relevance', 'link', 'link_batch'),
+                merged over DEFAULT_MODELS
+            task_backends (Dict[str, LLMBackend]): Backend overrides per task, e.g. a local model
+                for link triage
+            rate_limits (Dict[str, Dict[str, float]]): Per-model {'rpm': ..., 'tpm': ...} limits to
+                stay under, matching your account's tier; None disables throttling
+            default_rate_limit (Dict[str, float]): Limits for models missing from rate_limits
+            retry_policy (RetryPolicy): Backoff for transient LLM errors
+            circuit_failure_threshold (int): Consecutive LLM failures that open a backend's circuit
+            circuit_reset_timeout (float): Seconds an open circuit waits before probing the backend
+            max_relevance_retries (int): Times a page whose relevance could not be determined is
+                re-queued before it is reported as unresolved
+            relevance_window_tokens (int): Tokens of page content shown to the relevance check
+            relevance_chunks (int): Windows of a long page scored concurrently; the page is relevant
+                as soon as one window is. 1 only scores the start of the page
+            template_learner (TemplateLearner): Detects text repeated across a site's pages
+            strip_boilerplate (bool): Whether to strip learned site template text before scoring and storage
+            content_mode (str): 'body' keeps all visible page text; 'main' keeps only the main content
+                region (<main>/role=main, else the longest <article>, else the densest text block)
+            duplicate_index (NearDuplicateIndex): SimHash index of already classified pages
+            detect_duplicates (bool): Whether near-duplicates of classified pages reuse their relevance
+                decision instead of being classified and stored again
         """
         
         
-        self.client = OpenAI(api_key=api_key)
+        if content_mode not in ('body', 'main'):
+            raise ValueError(f"content_mode must be 'body' or 'main', got {content_mode!r}")
+        self.backend = backend or OpenAIBackend(api_key, llm_base_url)
+        self.models = {**DEFAULT_MODELS, **(models or {})}
+        self.task_backends = task_backends or {}
+        self.rate_limiter = None
+        if rate_limits or default_rate_limit:
+            self.rate_limiter = RateLimiter(rate_limits or {}, default_rate_limit)
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.circuit_failure_threshold = circuit_failure_threshold
+        self.circuit_reset_timeout = circuit_reset_timeout
+        self.circuit_breakers: Dict[str, CircuitBreaker] = {}
+        self.max_relevance_retries = max_relevance_retries
+        self.relevance_window_tokens = relevance_window_tokens
+        self.relevance_chunks = max(1, relevance_chunks)
+        self.llm_semaphore = asyncio.Semaphore(max(1, max_llm_concurrency))
+        self.link_batch_size = link_batch_size
+        self.llm_cache = LLMCache(cache_path, cache_ttl, cache_max_entries) if cache_path else None
+        self.canonicalizer = canonicalizer or UrlCanonicalizer()
+        self.link_prefilter = (link_prefilter or LinkPrefilter()) if prefilter_links else None
+        self.template_learner = (template_learner or TemplateLearner()) if strip_boilerplate else None
+        self.content_mode = content_mode
+        # Pages per content region strategy ('landmark', 'article', 'density', 'body')
+        self.content_regions: Dict[str, int] = {}
+        self.duplicate_index = (duplicate_index or NearDuplicateIndex()) if detect_duplicates else None
+        # Near-duplicate URL -> URL of the classified page whose decision it reused
+        self.duplicates: Dict[str, str] = {}
+        self.resource_blocker: Optional[ResourceBlocker] = None
+        self.readiness = PageReadiness()
+        self.page_readiness: Dict[str, Dict[str, Any]] = {}
+        self.http_fast_path: Optional[HttpFastPath] = None
+        self.browser_pool: Optional[BrowserPool] = None
+        self.crawl_overhead: Dict[str, Any] = {}
+        self.result_sink: Optional[JsonlResultSink] = None
         self.visited_urls: Set[str] = set()
         self.page_relevance: Dict[str, bool] = {}
-        self.page_data: Dict[str, Dict[str, Any]] = {}
+        # Pages whose relevance came back unknown, with how often; retried later, never recorded as False
+        self.relevance_retries: Dict[str, int] = {}
+        self.retry_not_before: Dict[str, float] = {}
+        # Fetched, cleaned content of pages awaiting a relevance retry
+        self.unclassified_pages: Dict[str, Dict[str, Any]] = {}
+        # URLs that turned out not to be crawlable pages, with the reason (e.g. 'http_404')
+        self.skipped_pages: Dict[str, str] = {}
+        self.page_data: MutableMapping = PageStore(page_store_dir) if page_store_dir else {}
         self.depth_data: Dict[int, List[str]] = {}
         self.keywords: List[str] = []
+        # URLs enqueued but not yet fully processed, as [depth, priority]; in-flight pages included
+        self.frontier_pending: Dict[str, List[float]] = {}
+        self.frontier_seq = itertools.count()
+        self.pages_crawled = 0
+        # Pages counted in pages_crawled whose fetch and classification have not finished yet
+        self.in_flight: Set[str] = set()
+        self.crawl_active = False
+        self.budget = CrawlBudget()
+        self.metrics = CrawlMetrics(metrics_hook)
+
+    async def chat_completion(self, messages: List[Dict[str, str]], task: str = 'other', 
+                              model: Optional[str] = None, temperature: float = 0.3) -> str:
+        """
+        Run a chat completion without blocking the event loop, bounded by the in-flight limit.
+        
+        Transient errors are retried with backoff. Raises the last error once retries run out,
+        or CircuitOpenError while the backend's circuit is open.
+        
+        Args:
+            task (str): LLM task ('keywords', 'relevance', 'link', 'link_batch'); selects the
+                backend and model, and labels timing metrics
+            model (str): Explicit model, overriding the task's configured one
+        """
+        
+        
+        backend = self.task_backends.get(task, self.backend)
+        model = model or self.models.get(task, self.models['relevance'])
+        breaker = self.circuit_breaker(backend)
+        
+        with self.metrics.timer(f'llm.{task}'):
+            cache_key = None
+            if self.llm_cache:
+                cache_key = LLMCache.fingerprint(f'{backend.name}:{model}', messages, temperature)
+                cached = self.llm_cache.get(cache_key)
+                if cached is not None:
+                    return cached
+        
+            attempt = 0
+            while True:
+                if not breaker.allow():
+                    raise CircuitOpenError(
+                        f"LLM backend {backend.name} unavailable, retrying in {breaker.retry_after():.0f}s"
+                    )
+                # Only a half-open circuit sets probing when letting a request through
+                is_probe = breaker.probing
+                
+                try:
+                    estimated_tokens = 0
+                    if self.rate_limiter:
+                        # Prompt tokens plus a small allowance for the reply; corrected with real usage below
+                        estimated_tokens = sum(estimate_tokens(m['content'], model) + 4 for m in messages) + 64
+                        waited = await self.rate_limiter.acquire(model, estimated_tokens)
+                        if waited:
+                            self.metrics.record('llm.throttle_wait', waited)
+                    
+                    queued_at = time.perf_counter()
+                    async with self.llm_semaphore:
+                        self.metrics.record('llm.queue_wait', time.perf_counter() - queued_at)
+                        with self.metrics.timer('llm.request'):
+                            result = await backend.complete(model, messages, temperature)
+                    breaker.record_success()
+                    break
+                except Exception as e:
+                    if not self.retry_policy.is_retryable(e):
+                        # The backend answered, it just rejected this request
+                        breaker.record_success()
+                        raise
+                    breaker.record_failure()
+                    attempt += 1
+                    if attempt >= self.retry_policy.max_attempts:
+                        raise
+                    delay = self.retry_policy.delay(attempt)
+                    self.retry_policy.retries += 1
+                    logging.warning(
+                        f"LLM {task} request failed ({type(e).__name__}: {str(e)}), "
+                        f"retry {attempt} in {delay:.1f}s"
+                    )
+                    self.metrics.record('llm.retry_wait', delay)
+                    await asyncio.sleep(delay)
+                except BaseException:
+                    # Cancelled mid-request (e.g. an early exit in chunked scoring): without this an
+                    # unfinished half-open probe would keep the circuit from ever closing
+                    if is_probe:
+                        breaker.release_probe()
+                    raise
+            
+            content = result['content']
+            self.budget.record_usage(model, result['prompt_tokens'], result['completion_tokens'])
+            if self.rate_limiter:
+                self.rate_limiter.settle(
+                    model, estimated_tokens, result['prompt_tokens'] + result['completion_tokens']
+                )
+        
+            if self.llm_cache:
+                self.llm_cache.put(cache_key, model, content)
+                if self.llm_cache.needs_flush():
+                    await self.llm_cache.flush()
+            return content
+
+    def circuit_breaker(self, backend: LLMBackend) -> CircuitBreaker:
+        if backend.name not in self.circuit_breakers:
+            self.circuit_breakers[backend.name] = CircuitBreaker(
+                self.circuit_failure_threshold, self.circuit_reset_timeout
+            )
+        return self.circuit_breakers[backend.name]
 
     async def get_semantic_keywords(self, instruction: str) -> List[str]:
         """
@@ -60,16 +2266,15 @@ class Rufus:
         Return ONLY a comma-separated list of keywords, no explanations."""
 
         try:
-            response = self.client.chat.completions.create(
-                model="o1-mini",
+            response = await self.chat_completion(
+                task="keywords",
                 messages=[
                     {"role": "system", "content": "You are a semantic analysis expert. Return only a comma-separated list of keywords."},
                     {"role": "user", "content": prompt}
-                ],
-                temperature=0.3
+                ]
             )
             
-            keywords = [kw.strip() for kw in response.choices[0].message.content.split(',')]
+            keywords = [kw.strip() for kw in response.split(',')]
             logging.info(f"Generated keywords: {keywords}")
             return keywords
             
@@ -77,9 +2282,46 @@ class Rufus:
             logging.error(f"Error generating keywords: {str(e)}")
             return []
 
-    def is_content_relevant(self, content: str, instruction: str, keywords: List[str]) -> bool:
+    async def is_content_relevant(self, content: str, instruction: str, 
+                                  keywords: List[str]) -> Optional[bool]:
         """
         Determine if page content is relevant using semantic analysis.
+        
+        The page is cut into token windows and up to relevance_chunks of them are scored
+        concurrently; the first relevant window decides and the rest are cancelled.
+        
+        Returns None when the LLM could not be reached, so the page can be retried later
+        instead of being recorded as irrelevant.
+        """
+        
+        
+        model = self.models['relevance']
+        windows = split_by_tokens(content, self.relevance_window_tokens, self.relevance_chunks, model)
+        if len(windows) == 1:
+            return await self.is_excerpt_relevant(windows[0], instruction, keywords)
+        
+        tasks = [
+            asyncio.ensure_future(self.is_excerpt_relevant(window, instruction, keywords))
+            for window in windows
+        ]
+        verdicts = []
+        try:
+            for next_verdict in asyncio.as_completed(tasks):
+                verdict = await next_verdict
+                if verdict:
+                    logging.info(f"Relevant window found after {len(verdicts) + 1} of {len(windows)} scored")
+                    return True
+                verdicts.append(verdict)
+        finally:
+            for task in tasks:
+                task.cancel()
+        # Irrelevant only if every window was judged; otherwise the page stays undecided
+        return None if None in verdicts else False
+
+    async def is_excerpt_relevant(self, excerpt: str, instruction: str, 
+                                  keywords: List[str]) -> Optional[bool]:
+        """
+        Ask the LLM whether one excerpt of a page is relevant (None if it could not be reached).
         """
         
         
@@ -90,7 +2332,7 @@ class Rufus:
         
         Content (excerpt):
         \"\"\"
-        {content[:2000]}
+        {excerpt}
         \"\"\"
         
         Consider:
@@ -103,30 +2345,30 @@ class Rufus:
         Answer ONLY with TRUE or FALSE."""
 
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-4o",
+            response = await self.chat_completion(
+                task="relevance",
                 messages=[
                     {"role": "system", "content": "You are a content relevance analyst. Respond only with TRUE or FALSE."},
                     {"role": "user", "content": prompt}
-                ],
-                temperature=0.3
+                ]
             )
             
-            is_relevant = response.choices[0].message.content.strip().upper() == "TRUE"
+            is_relevant = response.strip().upper() == "TRUE"
             logging.info(f"Content relevance: {is_relevant}")
             return is_relevant
             
         except Exception as e:
             logging.error(f"Error checking content relevance: {str(e)}")
-            return False
+            return None
 
     async def should_follow_link(self, link_text: str, href: str, 
                                instruction: str, keywords: List[str], 
-                               surrounding_text: str = "") -> bool:
+                               surrounding_text: str = "") -> Optional[bool]:
         """
         Determine if a link should be followed based on semantic analysis.
-        """
         
+        Returns None when the LLM could not be reached.
+        """
         
         
         prompt = f"""Should we follow this link based on the instruction and context?
@@ -149,47 +2391,171 @@ class Rufus:
         Answer ONLY with TRUE or FALSE."""
 
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-4",
+            response = await self.chat_completion(
+                task="link",
                 messages=[
                     {"role": "system", "content": "You are a link relevance analyst. Respond only with TRUE or FALSE."},
                     {"role": "user", "content": prompt}
-                ],
-                temperature=0.3
+                ]
             )
             
-            should_follow = response.choices[0].message.content.strip().upper() == "TRUE"
+            should_follow = response.strip().upper() == "TRUE"
             logging.info(f"Should follow {href}: {should_follow}")
             return should_follow
             
         except Exception as e:
             logging.error(f"Error checking link relevance: {str(e)}")
-            return False
+            return None
+
+    async def classify_links_batch(self, links: List[Dict[str, str]], instruction: str, 
+                                   keywords: List[str], 
+                                   scores: Optional[Dict[str, float]] = None) -> Dict[str, Optional[bool]]:
+        """
+        Decide which of a batch of links to follow with a single LLM request.
+        
+        A link maps to None when no decision could be made for it.
+        
+        Args:
+            links (List[Dict[str, str]]): Links with 'url', 'text' and 'context' keys
+            scores (Dict[str, float]): If given, filled with the model's 0-1 priority per URL
+        """
+        
+        
+        link_lines = "\n".join(
+            f'{i}. Text: {json.dumps(link["text"])} | URL: {link["url"]} | Context: {json.dumps(link["context"])}'
+            for i, link in enumerate(links)
+        )
+        prompt = f"""Decide which of these links we should follow based on the instruction and context.
+        
+        Instruction: "{instruction}"
+        Keywords: {', '.join(keywords)}
+        
+        Links:
+        {link_lines}
+        
+        Consider for each link:
+        1. Relevance to instruction
+        2. Keyword matches
+        3. URL structure/path
+        4. Link context
+        5. Potential information value
+        
+        For each link also give a score from 0 to 1 for how likely it leads to relevant content.
+        
+        Return ONLY a JSON array with one object per link, e.g. [{{"id": 0, "follow": true, "score": 0.8}}]."""
+
+        try:
+            response = await self.chat_completion(
+                task="link_batch",
+                messages=[
+                    {"role": "system", "content": "You are a link relevance analyst. Respond only with a JSON array."},
+                    {"role": "user", "content": prompt}
+                ]
+            )
+            
+            match = re.search(r'\[.*\]', response, re.S)
+            decisions = json.loads(match.group(0)) if match else []
+            decisions = {int(d['id']): d for d in decisions if isinstance(d, dict) and 'id' in d}
+            if not all(i in decisions for i in range(len(links))):
+                raise ValueError(f"batch response covered {len(decisions)} of {len(links)} links")
+            
+            link_relevance = {}
+            for i, link in enumerate(links):
+                link_relevance[link['url']] = str(decisions[i].get('follow')).lower() == 'true'
+                if scores is not None:
+                    try:
+                        scores[link['url']] = min(1.0, max(0.0, float(decisions[i]['score'])))
+                    except (KeyError, TypeError, ValueError):
+                        pass
+            logging.info(f"Batch link decisions: {sum(link_relevance.values())}/{len(links)} to follow")
+            return link_relevance
+            
+        except CircuitOpenError as e:
+            logging.warning(f"Batch link classification skipped: {str(e)}")
+            return {link['url']: None for link in links}
+        except Exception as e:
+            logging.warning(f"Batch link classification failed, falling back to per-link: {str(e)}")
+            decisions = await asyncio.gather(*(
+                self.should_follow_link(link['text'], link['url'], instruction, keywords, link['context'])
+                for link in links
+            ))
+            return dict(zip((link['url'] for link in links), decisions))
+
+    async def extract_page_links(self, page, max_context_chars: int = 200) -> List[Dict[str, str]]:
+        """
+        Extract href, text and surrounding context of all anchors in a single round trip.
+        """
+        
+        
+        return await page.eval_on_selector_all('a[href]', LINK_EXTRACTION_SCRIPT, max_context_chars)
 
-    async def analyze_page_links(self, page, current_url: str, base_url: str, 
-                               instruction: str) -> Dict[str, bool]:
+    async def analyze_page_links(self, links: List[Dict[str, str]], current_url: str, base_url: str, 
+                               instruction: str, 
+                               scores: Optional[Dict[str, float]] = None) -> Dict[str, Optional[bool]]:
         """
-        Analyze all links on the current page for relevance.
+        Analyze all links on the current page for relevance (None where the LLM could not decide).
+        
+        Args:
+            links (List[Dict[str, str]]): Raw anchors with 'href', 'text' and 'context' keys
+            scores (Dict[str, float]): If given, filled with a 0-1 priority per candidate URL,
+                from the LLM where it scored the link and local keyword matching otherwise
         """
         
         
         link_relevance = {}
         try:
-            links = await page.query_selector_all('a[href]')
+            candidates = {}
             for link in links:
-                href = await link.get_attribute('href')
+                href = link['href']
                 if href:
-                    absolute_url = urljoin(current_url, href)
-                    if absolute_url.startswith(base_url) and absolute_url not in self.visited_urls:
-                        link_text = await link.inner_text()
-                        parent = await link.evaluate('element => element.parentElement.textContent')
-                        surrounding_text = parent[:200] if parent else ""
-                        
-                        is_relevant = await self.should_follow_link(
-                            link_text, absolute_url, instruction, 
-                            self.keywords, surrounding_text
-                        )
-                        link_relevance[absolute_url] = is_relevant
+                    absolute_url = self.canonicalizer.canonicalize(urljoin(current_url, href))
+                    if (absolute_url.startswith(base_url) and absolute_url not in self.visited_urls
+                            and absolute_url not in candidates):
+                        candidates[absolute_url] = {
+                            'url': absolute_url,
+                            'text': link['text'],
+                            'context': link['context']
+                        }
+            
+            candidate_links = list(candidates.values())
+            with self.metrics.timer('links.local_scoring'):
+                local_scores = (self.link_prefilter or LinkPrefilter()).score_links(
+                    candidate_links, instruction, self.keywords
+                )
+            if scores is not None:
+                scores.update(local_scores)
+            
+            # Settle clear-cut links locally and only escalate the uncertain band to the LLM
+            if self.link_prefilter:
+                triage = self.link_prefilter.triage(
+                    candidate_links, instruction, self.keywords, local_scores, base_url
+                )
+                link_relevance = {url: True for url, d in triage.items() if d == 'accept'}
+                link_relevance.update({url: False for url, d in triage.items() if d == 'reject'})
+                candidate_links = [link for link in candidate_links if triage[link['url']] == 'escalate']
+                logging.info(
+                    f"Prefilter on {current_url}: {len(link_relevance)} decided locally, "
+                    f"{len(candidate_links)} escalated "
+                    f"(overall escalation rate {self.link_prefilter.stats()['escalation_rate']:.0%})"
+                )
+            
+            # Classify the remaining links concurrently; the LLM semaphore bounds the fan-out
+            if self.link_batch_size > 1:
+                chunks = [
+                    candidate_links[i:i + self.link_batch_size]
+                    for i in range(0, len(candidate_links), self.link_batch_size)
+                ]
+                for decisions in await asyncio.gather(*(
+                    self.classify_links_batch(chunk, instruction, self.keywords, scores) for chunk in chunks
+                )):
+                    link_relevance.update(decisions)
+            else:
+                decisions = await asyncio.gather(*(
+                    self.should_follow_link(link['text'], link['url'], instruction, 
+                                            self.keywords, link['context'])
+                    for link in candidate_links
+                ))
+                link_relevance.update(zip((link['url'] for link in candidate_links), decisions))
             
             return link_relevance
             
@@ -197,121 +2563,600 @@ class Rufus:
             logging.error(f"Error in link analysis: {str(e)}")
             return link_relevance
 
-    async def crawl_page(self, page, current_url: str, base_url: str, instruction: str, 
-                        depth: int = 0, max_depth: int = 2):
+    async def fetch_page(self, url: str) -> Dict[str, Any]:
         """
-        Crawl a page and analyze its content and links.
+        Load a page's text, title and links, over HTTP when possible and in the browser otherwise.
         """
         
         
-        if depth > max_depth or current_url in self.visited_urls:
-            return
-            
-        self.visited_urls.add(current_url)
+        reason = None
+        if self.http_fast_path:
+            with self.metrics.timer('page.http_fetch'):
+                snapshot, reason = await self.http_fast_path.fetch(url, self.content_mode)
+            if snapshot:
+                self.http_fast_path.record('http')
+                return snapshot
+            logging.info(f"Escalating {url} to browser: {reason}")
+        
+        async with self.browser_pool.page() as page:
+            if self.resource_blocker:
+                await self.resource_blocker.install(page)
+            with self.metrics.timer('page.navigate'):
+                readiness = await self.readiness.load(page, url)
+            self.metrics.record('page.settle', readiness['waited_ms'] / 1000)
+            self.page_readiness[url] = readiness
+            with self.metrics.timer('page.extract_text'):
+                extracted = await page.evaluate(CONTENT_EXTRACTION_SCRIPT, self.content_mode)
+                title = await page.title()
+            with self.metrics.timer('page.extract_links'):
+                links = await self.extract_page_links(page)
+            snapshot = {
+                'url': page.url,
+                'content': extracted['text'],
+                'title': title,
+                'headings': extracted['headings'],
+                'region': extracted['region'],
+                'links': links,
+                'source': 'browser'
+            }
+        if self.http_fast_path:
+            self.http_fast_path.record('browser', reason)
+        logging.info(f"Rendered {url}: ready via {readiness['strategy']} in {readiness['load_ms']} ms")
+        return snapshot
+
+    async def crawl_page(self, current_url: str, base_url: str, instruction: str, 
+                        depth: int = 0, max_depth: int = 2) -> List[Tuple[str, float]]:
+        """
+        Crawl a single page, analyze its content and return the links to follow with their priority.
+        """
+        
         
         if depth not in self.depth_data:
             self.depth_data[depth] = []
         
         try:
-            # Generate keywords if not already done
-            if not self.keywords:
-                self.keywords = await self.get_semantic_keywords(instruction)
+            with self.metrics.timer('page.fetch'):
+                snapshot = await self.fetch_page(current_url)
+            logging.info(f"Crawling depth {depth}: {current_url} (via {snapshot['source']})")
             
-            await page.goto(current_url)
-            logging.info(f"Crawling depth {depth}: {current_url}")
+            if current_url in self.page_relevance:
+                # Classified and stored before a checkpoint taken during its link analysis;
+                # on resume only the link analysis is redone
+                is_relevant = self.page_relevance[current_url]
+            else:
+                # Get and analyze content
+                content = snapshot['content']
+                self.content_regions[snapshot['region']] = self.content_regions.get(snapshot['region'], 0) + 1
+                if self.template_learner:
+                    content = self.template_learner.strip(current_url, content)
+                page = {'content': content, 'title': snapshot['title'], 'headings': snapshot['headings']}
+                is_relevant = await self.classify_page(current_url, depth, page, instruction)
             
-            await page.wait_for_load_state('networkidle')
-            await asyncio.sleep(1)
-            
-            # Get and analyze content
-            content = await page.inner_text('body')
-            is_relevant = self.is_content_relevant(content, instruction, self.keywords)
-            self.page_relevance[current_url] = is_relevant
-            
-            # Store relevant page data
-            if is_relevant:
-                self.page_data[current_url] = {
-                    'url': current_url,
-                    'depth': depth,
-                    'content': content,
-                    'crawl_time': datetime.now().isoformat(),
-                    'title': await page.title(),
-                    'matched_keywords': self.keywords
-                }
-                self.depth_data[depth].append(current_url)
-            
-            # Analyze and follow links if not at max depth
+            # Analyze links if not at max depth
             if depth < max_depth:
-                link_relevance = await self.analyze_page_links(page, current_url, base_url, instruction)
-                
-                for url, relevant in link_relevance.items():
-                    if relevant and url not in self.visited_urls:
-                        await self.crawl_page(
-                            page, url, base_url, instruction, 
-                            depth + 1, max_depth
-                        )
+                scores: Dict[str, float] = {}
+                with self.metrics.timer('page.link_analysis'):
+                    link_relevance = await self.analyze_page_links(
+                        snapshot['links'], snapshot['url'], base_url, instruction, scores
+                    )
+                # Links the LLM could not judge are still followed, at half the priority of chosen ones
+                return [
+                    (url, self.link_priority(scores.get(url, 0.5), bool(is_relevant)) * (1.0 if relevant else 0.5))
+                    for url, relevant in link_relevance.items() if relevant is not False
+                ]
                         
+        except PageSkipped as e:
+            self.skipped_pages[current_url] = str(e)
+            logging.info(f"Skipping {current_url}: {str(e)}")
         except Exception as e:
             logging.error(f"Error crawling {current_url}: {str(e)}")
+        
+        return []
 
-    def save_results(self, base_url: str, instruction: str):
+    async def classify_page(self, current_url: str, depth: int, page: Dict[str, Any], 
+                            instruction: str) -> Optional[bool]:
+        """
+        Decide a fetched page's relevance and store it if relevant.
+        
+        Args:
+            page (Dict[str, Any]): Cleaned 'content' plus 'title' and 'headings'; kept for a later
+                retry if the relevance could not be determined
+        """
+        
+        
+        # Near-duplicates of an already classified page reuse its decision
+        content = page['content']
+        fingerprint = original = None
+        if self.duplicate_index:
+            with self.metrics.timer('page.fingerprint'):
+                fingerprint = self.duplicate_index.fingerprint(content)
+            if fingerprint is not None:
+                original = self.duplicate_index.find(fingerprint)
+        if original:
+            is_relevant = self.page_relevance[original]
+            self.duplicates[current_url] = original
+            logging.info(f"{current_url} is a near-duplicate of {original}, reusing its relevance")
+        else:
+            is_relevant = await self.is_content_relevant(content, instruction, self.keywords)
+            if is_relevant is not None and fingerprint is not None:
+                self.duplicate_index.add(current_url, fingerprint)
+        
+        if is_relevant is None:
+            attempts = self.relevance_retries.get(current_url, 0) + 1
+            self.relevance_retries[current_url] = attempts
+            # Retries only repeat the relevance check, not the fetch and link analysis
+            self.unclassified_pages[current_url] = page
+            logging.warning(f"Relevance of {current_url} unknown after attempt {attempts}")
+            return None
+        self.unclassified_pages.pop(current_url, None)
+        self.page_relevance[current_url] = is_relevant
+        
+        # Store relevant page data; a near-duplicate's content is already stored under its original
+        if is_relevant and not original and current_url not in self.page_data:
+            record = {
+                'url': current_url,
+                'depth': depth,
+                'content': content,
+                'crawl_time': datetime.now().isoformat(),
+                'title': page['title'],
+                'headings': page['headings'],
+                'matched_keywords': self.keywords
+            }
+            self.page_data[current_url] = record
+            self.depth_data.setdefault(depth, []).append(current_url)
+            if self.result_sink:
+                self.result_sink.write_page(record)
+        return is_relevant
+
+    def link_priority(self, link_score: float, parent_relevant: bool) -> float:
+        """
+        Best-first frontier priority: mostly the link's own score, boosted when its page was relevant.
+        """
+        
+        
+        return 0.7 * link_score + (0.3 if parent_relevant else 0.0)
+
+    async def crawl_worker(self, worker_id: int, frontier: asyncio.PriorityQueue, 
+                           base_url: str, instruction: str, max_depth: int):
+        """
+        Drain the shared frontier, always crawling the highest-priority URL next.
+        """
+        
+        
+        while True:
+            _, _, url, depth = await frontier.get()
+            try:
+                not_before = self.retry_not_before.pop(url, None)
+                if not_before:
+                    await asyncio.sleep(max(0.0, not_before - time.monotonic()))
+                if self.budget.check(self.pages_crawled):
+                    # Budget spent: leave the URL pending so a resumed crawl with a larger budget gets it
+                    continue
+                attempts = self.relevance_retries.get(url, 0)
+                # Retries and pages resumed mid link analysis were already counted
+                if not attempts and url not in self.page_relevance:
+                    self.pages_crawled += 1
+                    self.in_flight.add(url)
+                with self.metrics.timer('page.total'):
+                    if url in self.unclassified_pages:
+                        # Retry of a page whose relevance was unknown: its links were already queued
+                        await self.classify_page(url, depth, self.unclassified_pages[url], instruction)
+                        links = []
+                    else:
+                        links = await self.crawl_page(url, base_url, instruction, depth, max_depth)
+                for link, priority in links:
+                    self.enqueue(frontier, link, depth + 1, priority)
+                # Only an unknown relevance verdict earns a retry; fetch errors do not
+                if self.relevance_retries.get(url, 0) > attempts and attempts < self.max_relevance_retries:
+                    self.requeue(frontier, url, depth)
+                else:
+                    self.frontier_pending.pop(url, None)
+                    self.unclassified_pages.pop(url, None)
+            except Exception as e:
+                logging.error(f"Worker {worker_id} failed on {url}: {str(e)}")
+            finally:
+                self.in_flight.discard(url)
+                frontier.task_done()
+
+    def enqueue(self, frontier: asyncio.PriorityQueue, url: str, depth: int, priority: float = 1.0):
+        """
+        Add a URL to the frontier unless it has already been seen.
+        """
+        
+        
+        # Mark as visited on enqueue so no two workers pick up the same URL
+        if url not in self.visited_urls:
+            self.visited_urls.add(url)
+            self.frontier_pending[url] = [depth, priority]
+            # Highest priority first; the sequence number keeps equal priorities in discovery order
+            frontier.put_nowait((-priority, next(self.frontier_seq), url, depth))
+
+    def requeue(self, frontier: asyncio.PriorityQueue, url: str, depth: int):
+        """
+        Put a page whose relevance is still unknown back on the frontier, behind all fresh URLs
+        and not before its backoff (or the relevance backend's open circuit) has passed.
+        """
+        
+        
+        attempts = self.relevance_retries[url]
+        breaker = self.circuit_breaker(self.task_backends.get('relevance', self.backend))
+        delay = max(breaker.retry_after(), self.retry_policy.delay(attempts + 1))
+        self.retry_not_before[url] = time.monotonic() + delay
+        # Negative priorities sort after every fresh URL (those are scored 0 to 1)
+        priority = -float(attempts)
+        self.frontier_pending[url] = [depth, priority]
+        frontier.put_nowait((-priority, next(self.frontier_seq), url, depth))
+        logging.info(f"Re-queued {url} for relevance retry {attempts} in {delay:.1f}s")
+
+    async def budget_monitor(self, interval: float):
+        """
+        Log the remaining budget every interval seconds and trip time limits while workers are busy.
         """
-        Save crawl results to JSON file.
+        
+        
+        while True:
+            await asyncio.sleep(interval)
+            self.budget.check(self.pages_crawled)
+            logging.info(f"Remaining budget: {self.budget.remaining(self.pages_crawled)}")
+
+    def checkpoint_state(self, base_url: str, instruction: str, max_depth: int) -> Dict[str, Any]:
+        """
+        Snapshot everything needed to resume the crawl.
+        """
+        
+        
+        return {
+            'base_url': base_url,
+            'instruction': instruction,
+            'max_depth': max_depth,
+            'saved_at': datetime.now().isoformat(),
+            # In-flight pages stay pending and are counted again when the resumed crawl takes them
+            'pages_crawled': self.pages_crawled - sum(
+                1 for url in self.in_flight
+                if url not in self.page_relevance and not self.relevance_retries.get(url)
+            ),
+            'keywords': list(self.keywords),
+            'visited_urls': list(self.visited_urls),
+            'frontier': [[url, depth, priority] for url, (depth, priority) in self.frontier_pending.items()],
+            'page_relevance': dict(self.page_relevance),
+            'relevance_retries': dict(self.relevance_retries),
+            'duplicates': dict(self.duplicates),
+            'skipped_pages': dict(self.skipped_pages),
+            'fingerprints': dict(self.duplicate_index.fingerprints) if self.duplicate_index else {},
+            'page_data': self.page_data.snapshot() if isinstance(self.page_data, PageStore) else dict(self.page_data),
+            'depth_data': {str(depth): list(urls) for depth, urls in self.depth_data.items()},
+            'page_readiness': dict(self.page_readiness),
+            'results_path': self.result_sink.path if self.result_sink else None,
+            'results_offset': self.result_sink.pages_end if self.result_sink else None
+        }
+
+    def restore_page_data(self, snapshot: Dict[str, Any]):
+        """
+        Restore page_data from a checkpoint taken with or without a PageStore.
+        
+        Args:
+            snapshot (Dict[str, Any]): Either a PageStore snapshot or a plain url -> record mapping
+        """
+        
+        
+        is_store_snapshot = {'directory', 'meta', 'refs'} <= snapshot.keys()
+        if not is_store_snapshot:
+            if isinstance(self.page_data, PageStore):
+                # Checkpoint predates the page store: move its records into the store
+                self.page_data.restore({'meta': {}, 'refs': {}})
+                for url, record in snapshot.items():
+                    self.page_data[url] = record
+            else:
+                self.page_data = snapshot
+            return
+        
+        directory = snapshot['directory']
+        if isinstance(self.page_data, PageStore):
+            if os.path.abspath(directory) != os.path.abspath(self.page_data.directory):
+                raise ValueError(
+                    f"Checkpoint page content is stored in {directory!r}, "
+                    f"but page_store_dir is {self.page_data.directory!r}"
+                )
+            self.page_data.restore(snapshot)
+            return
+        if not os.path.isdir(directory):
+            raise ValueError(f"Checkpoint page store directory {directory!r} no longer exists")
+        # Keep reading the content the checkpointed crawl spilled to disk
+        logging.info(f"Checkpoint was taken with a page store; reopening {directory}")
+        self.page_data = PageStore(directory)
+        self.page_data.restore(snapshot)
+
+    def restore_state(self, state: Dict[str, Any], frontier: asyncio.PriorityQueue):
+        """
+        Load a checkpoint and re-queue every URL that was pending or in flight when it was taken.
+        """
+        
+        
+        # Page data first: it is the only part that can be incompatible with this instance
+        self.restore_page_data(state['page_data'])
+        self.keywords = state['keywords']
+        self.visited_urls = set(state['visited_urls'])
+        self.page_relevance = state['page_relevance']
+        self.pages_crawled = state.get('pages_crawled', len(self.page_relevance))
+        self.relevance_retries = state.get('relevance_retries', {})
+        self.duplicates = state.get('duplicates', {})
+        self.skipped_pages = state.get('skipped_pages', {})
+        if self.duplicate_index:
+            for url, fingerprint in state.get('fingerprints', {}).items():
+                self.duplicate_index.add(url, fingerprint)
+        self.depth_data = {int(depth): urls for depth, urls in state['depth_data'].items()}
+        self.page_readiness = state.get('page_readiness', {})
+        self.frontier_pending = {}
+        for url, depth, priority in state['frontier']:
+            self.frontier_pending[url] = [depth, priority]
+            frontier.put_nowait((-priority, next(self.frontier_seq), url, depth))
+        logging.info(
+            f"Resumed from checkpoint saved at {state['saved_at']}: "
+            f"{len(self.visited_urls)} visited, {len(self.frontier_pending)} pending"
+        )
+
+    async def checkpoint_loop(self, checkpoint: CrawlCheckpoint, base_url: str, instruction: str, 
+                              max_depth: int, interval: float):
         """
+        Save a checkpoint every interval seconds until cancelled.
+        """
+        
         
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await checkpoint.save(self.checkpoint_state(base_url, instruction, max_depth))
+            except Exception as e:
+                logging.error(f"Error saving checkpoint: {str(e)}")
+
+    def results_summary(self, base_url: str, instruction: str) -> Dict[str, Any]:
+        """
+        Crawl metadata, relevance map and depth analysis, without page content.
+        """
         
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f'semantic_results_{timestamp}.json'
         
-        results = {
+        return {
             'metadata': {
                 'base_url': base_url,
                 'instruction': instruction,
                 'crawl_time': datetime.now().isoformat(),
-                'total_pages': len(self.visited_urls),
+                'total_pages': self.pages_crawled,
+                'discovered_urls': len(self.visited_urls),
                 'relevant_pages': sum(1 for v in self.page_relevance.values() if v),
-                'keywords_used': self.keywords
+                'keywords_used': self.keywords,
+                'llm_cache': self.llm_cache.stats() if self.llm_cache else None,
+                'link_prefilter': self.link_prefilter.stats() if self.link_prefilter else None,
+                'boilerplate': self.template_learner.stats() if self.template_learner else None,
+                'content_extraction': {'mode': self.content_mode, 'regions': dict(self.content_regions)},
+                'near_duplicates': self.duplicate_index.stats() if self.duplicate_index else None,
+                'resource_blocking': self.resource_blocker.stats() if self.resource_blocker else None,
+                'fetch_paths': self.http_fast_path.stats() if self.http_fast_path else None,
+                'browser_pool': self.browser_pool.stats() if self.browser_pool else None,
+                'crawl_overhead': self.crawl_overhead,
+                'budget': self.budget.stats(self.pages_crawled),
+                'rate_limiter': self.rate_limiter.stats() if self.rate_limiter else None,
+                'llm_reliability': {
+                    **self.retry_policy.stats(),
+                    'circuit_breakers': {
+                        name: breaker.stats() for name, breaker in self.circuit_breakers.items()
+                    },
+                    'relevance_retries': sum(self.relevance_retries.values())
+                },
+                # Pages whose relevance could not be determined even after retrying
+                'unresolved_pages': [
+                    url for url in self.relevance_retries if url not in self.page_relevance
+                ]
             },
             'relevance_map': self.page_relevance,
+            'duplicates': self.duplicates,
+            'skipped_pages': self.skipped_pages,
             'depth_analysis': {
                 str(depth): {
                     'urls': urls,
                     'count': len(urls)
                 } for depth, urls in self.depth_data.items()
             },
-            'page_data': self.page_data
+            'page_readiness': self.page_readiness,
+            'performance': self.metrics.report()
         }
+
+    def save_results(self, base_url: str, instruction: str):
+        """
+        Save crawl results.
+        
+        When streaming, pages are already in the JSONL file and only the summary trailer is
+        appended; otherwise everything is written to a single JSON file.
+        """
         
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(results, f, ensure_ascii=False, indent=2)
+        
+        results = self.results_summary(base_url, instruction)
+        
+        if self.result_sink:
+            self.result_sink.write_trailer(results)
+            self.result_sink.close()
+            filename = self.result_sink.path
+        else:
+            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+            filename = f'semantic_results_{timestamp}.json'
+            
+            # Write page_data one record at a time so a spilled PageStore is never fully in memory
+            with open(filename, 'w', encoding='utf-8') as f:
+                f.write(json.dumps(results, ensure_ascii=False, indent=2)[:-2])
+                f.write(',\n  "page_data": {')
+                for i, (url, record) in enumerate(self.page_data.items()):
+                    entry = json.dumps(record, ensure_ascii=False, indent=2).replace('\n', '\n    ')
+                    f.write(f"{',' if i else ''}\n    {json.dumps(url, ensure_ascii=False)}: {entry}")
+                f.write('\n  }\n}')
         
         logging.info(f"Results saved to {filename}")
         return filename
 
-    async def crawl(self, base_url: str, instruction: str, max_depth: int = 2):
+    async def close(self):
+        """
+        Write out and close the LLM cache and close the LLM backends' clients.
+        """
+        
+        
+        if self.llm_cache:
+            await self.llm_cache.flush()
+            self.llm_cache.close()
+            self.llm_cache = None
+        backends = {id(b): b for b in [self.backend, *self.task_backends.values()]}
+        for backend in backends.values():
+            await backend.close()
+
+    async def crawl(self, base_url: str, instruction: str, max_depth: int = 2, 
+                    concurrency: int = 4, block_resources: bool = True, 
+                    resource_blocker: Optional[ResourceBlocker] = None, 
+                    readiness: Optional[PageReadiness] = None, http_fast_path: bool = True, 
+                    browser_pool: Optional[BrowserPool] = None, 
+                    checkpoint_path: Optional[str] = None, checkpoint_interval: float = 30.0, 
+                    resume: bool = False, output_format: str = 'jsonl', 
+                    max_pages: Optional[int] = None, max_tokens: Optional[int] = None, 
+                    max_cost_usd: Optional[float] = None, max_seconds: Optional[float] = None, 
+                    budget_log_interval: float = 30.0):
         """
         Main crawling function.
+        
+        Args:
+            base_url (str): Site to crawl; only links under this prefix are followed
+            instruction (str): What the crawl is looking for
+            max_depth (int): Maximum link depth from the base URL
+            concurrency (int): Number of concurrent workers
+            block_resources (bool): Abort images, media, fonts and trackers while rendering
+            resource_blocker (ResourceBlocker): Custom blocking profile for this crawl
+            readiness (PageReadiness): Page readiness detection and per-page timeout budget
+            http_fast_path (bool): Fetch pages over HTTP first and render only JS-dependent pages
+            browser_pool (BrowserPool): Browser to borrow pages from, which may be shared with other
+                Rufus instances crawling concurrently; a private one is started lazily and closed
+                after the crawl when omitted
+            checkpoint_path (str): File to periodically checkpoint crawl state to
+            checkpoint_interval (float): Seconds between checkpoints
+            resume (bool): Continue from the checkpoint at checkpoint_path instead of starting over
+            output_format (str): 'jsonl' streams page records as they are classified and appends a
+                summary trailer; 'json' writes one JSON document at the end
+            max_pages (int): Stop after this many pages; with the best-first frontier these are the
+                most promising pages found
+            max_tokens (int): Stop once LLM calls have used this many tokens
+            max_cost_usd (float): Stop once estimated LLM spend reaches this amount
+            max_seconds (float): Stop taking new pages after this much wall time
+            budget_log_interval (float): Seconds between remaining-budget log lines
         """
         
         
+        setup_start = time.perf_counter()
+        if self.crawl_active:
+            raise RuntimeError(
+                "This Rufus instance is already crawling; use one instance per concurrent crawl "
+                "(they can share a BrowserPool)"
+            )
+        if resume and not checkpoint_path:
+            raise ValueError("resume=True requires a checkpoint_path")
+        if output_format not in ('json', 'jsonl'):
+            raise ValueError(f"Unsupported output_format: {output_format}")
         if not base_url.startswith(('http://', 'https://')):
             base_url = 'https://' + base_url
         if not base_url.endswith('/'):
             base_url += '/'
+        # The canonical start URL is crawled; the slash-terminated base_url scopes the links
+        start_url = self.canonicalizer.canonicalize(base_url)
+        base_url = start_url if start_url.endswith('/') else start_url + '/'
+        concurrency = max(1, concurrency)
+        
+        checkpoint = CrawlCheckpoint(checkpoint_path) if checkpoint_path else None
+        frontier: asyncio.PriorityQueue = asyncio.PriorityQueue()
+        resumed = False
+        if resume and checkpoint.exists():
+            state = checkpoint.load()
+            if state['base_url'] != base_url or state['instruction'] != instruction:
+                raise ValueError(
+                    f"Checkpoint {checkpoint_path} belongs to a different crawl "
+                    f"({state['base_url']}, {state['instruction']!r})"
+                )
+            self.restore_state(state, frontier)
+            resumed = True
+        if not resumed:
+            self.pages_crawled = len(self.page_relevance)
+        self.budget = CrawlBudget(max_pages, max_tokens, max_cost_usd, max_seconds)
+        
+        self.result_sink = None
+        if output_format == 'jsonl':
+            # A resumed crawl keeps appending to the file it was already streaming into, cut back to
+            # the checkpoint so pages stored after it (and the old trailer) are not written twice
+            results_path = state.get('results_path') if resumed else None
+            results_offset = state.get('results_offset') if results_path else None
+            if not results_path:
+                results_path = f"semantic_results_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jsonl"
+            self.result_sink = JsonlResultSink(results_path, results_offset)
+        
+        self.resource_blocker = (resource_blocker or ResourceBlocker()) if block_resources else None
+        if readiness:
+            self.readiness = readiness
+            
+        self.http_fast_path = None
+        if http_fast_path:
+            self.http_fast_path = HttpFastPath(httpx.AsyncClient(
+                follow_redirects=True,
+                timeout=self.readiness.page_timeout,
+                limits=httpx.Limits(max_connections=concurrency * 2, max_keepalive_connections=concurrency),
+                headers={'User-Agent': 'Mozilla/5.0 (compatible; Rufus/1.0)'}
+            ))
+        
+        owns_pool = browser_pool is None
+        self.browser_pool = browser_pool or BrowserPool(max_pages=concurrency)
+        workers = []
+        self.crawl_overhead = {
+            'shared_browser_pool': not owns_pool,
+            'setup_seconds': round(time.perf_counter() - setup_start, 3)
+        }
+        
+        # Nothing above awaits, so a concurrent crawl() on this instance cannot slip in before this
+        self.crawl_active = True
+        try:
+            # Generate keywords once, before any worker needs them
+            if not self.keywords:
+                self.keywords = await self.get_semantic_keywords(instruction)
             
-        async with async_playwright() as p:
-            browser = await p.chromium.launch(headless=True)
-            page = await browser.new_page()
+            if not resumed:
+                self.enqueue(frontier, start_url, 0)
             
-            try:
-                await self.crawl_page(page, base_url, base_url, instruction, max_depth=max_depth)
-                filename = self.save_results(base_url, instruction)
-                logging.info(f"Crawl completed successfully. Results saved to {filename}")
-                
-            except Exception as e:
-                logging.error(f"Crawl failed: {str(e)}")
-            finally:
-                await browser.close()
+            workers.append(asyncio.create_task(self.budget_monitor(budget_log_interval)))
+            if checkpoint:
+                workers.append(asyncio.create_task(self.checkpoint_loop(
+                    checkpoint, base_url, instruction, max_depth, checkpoint_interval
+                )))
+            workers += [
+                asyncio.create_task(self.crawl_worker(
+                    i, frontier, base_url, instruction, max_depth
+                ))
+                for i in range(concurrency)
+            ]
+            await frontier.join()
+            
+            filename = self.save_results(base_url, instruction)
+            logging.info(f"Crawl completed successfully. Results saved to {filename}")
+            
+        except Exception as e:
+            logging.error(f"Crawl failed: {str(e)}")
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            if checkpoint:
+                # Final snapshot, also taken when the crawl is interrupted
+                try:
+                    await checkpoint.save(self.checkpoint_state(base_url, instruction, max_depth))
+                except Exception as e:
+                    logging.error(f"Error saving checkpoint: {str(e)}")
+            if self.result_sink:
+                self.result_sink.close()
+            if owns_pool:
+                await self.browser_pool.close()
+            if self.http_fast_path:
+                await self.http_fast_path.client.aclose()
+            if self.llm_cache:
+                await self.llm_cache.flush()
+            self.crawl_active = False
 
 async def main():
     """
@@ -324,10 +3169,14 @@ async def main():
     base_url = input("Enter the base URL to crawl: ").strip()
     instruction = input("Enter your search instruction: ").strip()
     max_depth = int(input("Enter maximum crawl depth (default 2): ") or "2")
+    concurrency = int(input("Enter number of concurrent pages (default 4): ") or "4")
     
     print("\nStarting crawl...")
     crawler = Rufus(api_key)
-    await crawler.crawl(base_url, instruction, max_depth)
+    try:
+        await crawler.crawl(base_url, instruction, max_depth, concurrency=concurrency)
+    finally:
+        await crawler.close()
     print("Crawl completed!")
 
 if __name__ == "__main__":
@@ -0,0 +1,62 @@
+import asyncio
+import time
+import unittest
+
+from rufus import CircuitBreaker, Rufus, StubBackend
+
+
+class HangingBackend(StubBackend):
+    """
+    Backend whose requests never finish until released, so a test can cancel one mid-flight.
+    """
+
+    def __init__(self):
+        super().__init__('TRUE')
+        self.started = asyncio.Event()
+        self.release = asyncio.Event()
+
+    async def complete(self, model, messages, temperature):
+        self.started.set()
+        await self.release.wait()
+        return await super().complete(model, messages, temperature)
+
+
+class CircuitBreakerTest(unittest.TestCase):
+    def test_cancelled_half_open_probe_releases_the_circuit(self):
+        async def scenario():
+            backend = HangingBackend()
+            crawler = Rufus(backend=backend, cache_path=None, circuit_reset_timeout=0.05)
+            breaker = crawler.circuit_breaker(backend)
+            for _ in range(breaker.failure_threshold):
+                breaker.record_failure()
+            await asyncio.sleep(0.06)
+            self.assertEqual(breaker.state, 'half_open')
+
+            messages = [{'role': 'user', 'content': 'probe'}]
+            probe = asyncio.ensure_future(crawler.chat_completion(messages, task='relevance'))
+            await backend.started.wait()
+            self.assertTrue(breaker.probing)
+            probe.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await probe
+            self.assertFalse(breaker.probing)
+
+            # The next request is let through as the probe and closes the circuit
+            backend.release.set()
+            self.assertEqual(await crawler.chat_completion(messages, task='relevance'), 'TRUE')
+            self.assertEqual(breaker.state, 'closed')
+
+        asyncio.run(scenario())
+
+    def test_open_circuit_rejects_until_reset_timeout(self):
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+        breaker.record_failure()
+        breaker.record_failure()
+        self.assertFalse(breaker.allow())
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+
+
+if __name__ == '__main__':
+    unittest.main()